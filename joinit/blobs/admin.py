@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import MediaBlob
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('file', 'digest', 'size', 'ref_count', 'created_at')
+    search_fields = ('digest', 'file')
+    readonly_fields = ('file', 'digest', 'size', 'ref_count', 'created_at')
@@ -0,0 +1,92 @@
+from collections import Counter
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from blobs.models import MediaBlob, file_digest
+from events.models import Event
+from users.models import CustomUser
+
+# (modello, campo) che salvano i propri file nel blob store
+REFERENCES = [
+    (Event, 'cover_image'),
+    (CustomUser, 'profile_picture'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Registra nel blob store le copertine e le immagini profilo esistenti, "
+        "unifica i file duplicati e ricalcola i contatori dei riferimenti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Mostra cosa verrebbe fatto senza modificare nulla.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        references = Counter()
+        for model, field in REFERENCES:
+            rows = (
+                model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .values(field).annotate(n=Count('pk')).values_list(field, 'n')
+            )
+            for name, n in rows:
+                references[name] += n
+
+        blobs_by_name = {blob.file.name: blob for blob in MediaBlob.objects.all()}
+        blobs_by_digest = {blob.digest: blob for blob in blobs_by_name.values()}
+        duplicates = {}
+        missing = 0
+
+        for name in references:
+            if name in blobs_by_name:
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                continue
+            with default_storage.open(name, 'rb') as file:
+                digest = file_digest(file)
+            if digest in blobs_by_digest:
+                duplicates[name] = blobs_by_digest[digest].file.name
+                continue
+            blob = MediaBlob(digest=digest, file=name, size=default_storage.size(name))
+            blobs_by_name[name] = blobs_by_digest[digest] = blob
+
+        for name, canonical in duplicates.items():
+            references[canonical] += references.pop(name)
+
+        self.stdout.write(
+            f'{len(blobs_by_name)} blobs, {len(duplicates)} duplicate files, {missing} missing files.'
+        )
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            for name, canonical in duplicates.items():
+                for model, field in REFERENCES:
+                    model.objects.filter(**{field: name}).update(**{field: canonical})
+                transaction.on_commit(lambda name=name: default_storage.delete(name))
+
+            new_blobs, existing_blobs, orphans = [], [], []
+            for blob in blobs_by_name.values():
+                blob.ref_count = references.get(blob.file.name, 0)
+                if blob.pk is None:
+                    new_blobs.append(blob)
+                elif blob.ref_count:
+                    existing_blobs.append(blob)
+                else:
+                    orphans.append(blob)
+
+            MediaBlob.objects.bulk_create(new_blobs, batch_size=500)
+            MediaBlob.objects.bulk_update(existing_blobs, ['ref_count'], batch_size=500)
+            MediaBlob.objects.filter(pk__in=[blob.pk for blob in orphans]).update(ref_count=0)
+            for blob in orphans:
+                # Come release(): un upload arrivato nel frattempo salva il file
+                transaction.on_commit(partial(MediaBlob.objects.delete_unused, blob.file.name))
+
+        self.stdout.write(self.style.SUCCESS('Blob store aggiornato.'))
@@ -0,0 +1,122 @@
+import hashlib
+from functools import partial
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+
+def file_digest(file):
+    """Calcola lo SHA-256 del contenuto di un file."""
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def blob_path(digest, filename):
+    return f'blobs/{digest[:2]}/{digest}{Path(filename).suffix.lower()}'
+
+
+def store_blob(name, file):
+    """Scrive il file di un nuovo blob. Il nome dipende solo dal contenuto: se esiste già è lo stesso file."""
+    if not default_storage.exists(name):
+        default_storage.save(name, file)
+
+
+class MediaBlobManager(models.Manager):
+
+    def acquire(self, file):
+        """
+        Restituisce il nome del blob con lo stesso contenuto di ``file`` e ne
+        incrementa i riferimenti. Il file viene scritto su disco solo se il
+        contenuto non è già presente, al commit della transazione: se questa
+        viene annullata non resta nessun file orfano. Anche quando il blob
+        esiste già il file viene riscritto se manca (scrittura fallita dopo il commit).
+        """
+        digest = file_digest(file)
+        name = blob_path(digest, file.name)
+        while True:
+            with transaction.atomic():
+                if self.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+                    name = self.filter(digest=digest).values_list('file', flat=True).get()
+                    break
+
+            try:
+                with transaction.atomic():
+                    self.create(digest=digest, file=name, size=file.size, ref_count=1)
+            except IntegrityError:
+                # Upload concorrente dello stesso contenuto: usiamo il suo blob
+                continue
+            break
+        transaction.on_commit(partial(store_blob, name, file))
+        return name
+
+    def retain(self, name):
+        """Aggiunge un riferimento a un blob esistente."""
+        if name:
+            self.filter(file=name).update(ref_count=F('ref_count') + 1)
+
+    def release(self, name):
+        """
+        Rimuove un riferimento; blob e file vengono eliminati dopo il commit
+        se non resta nessun riferimento (delete_unused). I file non gestiti
+        dallo store non vengono toccati.
+        """
+        if not name:
+            return
+        with transaction.atomic():
+            blob = self.select_for_update().filter(file=name).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                self.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            else:
+                self.filter(pk=blob.pk).update(ref_count=0)
+                transaction.on_commit(partial(self.delete_unused, name))
+
+    def delete_unused(self, name):
+        """
+        Elimina blob e file se il blob ha ancora zero riferimenti. La riga resta
+        bloccata fino alla cancellazione del file: un acquire concorrente dello
+        stesso contenuto la ritrova usata (e il file resta) oppure aspetta,
+        non la trova più e riscrive il file con un nuovo blob.
+        """
+        with transaction.atomic():
+            blob = self.select_for_update().filter(file=name, ref_count=0).first()
+            if blob is None:
+                return
+            blob.delete()
+            default_storage.delete(name)
+
+    def replace(self, old_name, new_file):
+        """
+        Sposta un riferimento da ``old_name`` a ``new_file`` (upload, file già
+        salvato o vuoto) e restituisce il nome da salvare sul modello.
+        """
+        if not new_file:
+            new_name = None
+        elif not new_file._committed:
+            new_name = self.acquire(new_file)
+        else:
+            new_name = new_file.name
+            if new_name != old_name:
+                self.retain(new_name)
+
+        if old_name and old_name != new_name:
+            self.release(old_name)
+        return new_name
+
+
+class MediaBlob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = MediaBlobManager()
+
+    def __str__(self):
+        return f'{self.file.name} ({self.ref_count} refs)'
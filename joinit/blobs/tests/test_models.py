@@ -0,0 +1,105 @@
+import datetime
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from blobs.models import MediaBlob
+from events.models import Event
+from users.models import CustomUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaBlobTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='joinit@user.it', password='mypassword')
+
+    def _create_event(self, cover):
+        date = timezone.now() + datetime.timedelta(days=7)
+        return Event.objects.create(
+            name='Evento test', description='Descrizione', created_by=self.user,
+            event_date=date, participation_deadline=date, cover_image=cover,
+        )
+
+    def _upload(self, content=b'same-image-content'):
+        return SimpleUploadedFile('cover.png', content, content_type='image/png')
+
+    def test_same_content_is_stored_once(self):
+        first = self._create_event(self._upload())
+        second = self._create_event(self._upload())
+        self.user.profile_picture = self._upload()
+        self.user.save()
+
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+        self.assertEqual(self.user.profile_picture.name, first.cover_image.name)
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+
+    def test_file_is_deleted_with_last_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_event(self._upload())
+            second = self._create_event(self._upload())
+        name = first.cover_image.name
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.cover_image = self._upload(b'another-image-content')
+            second.save()
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get().file.name, second.cover_image.name)
+
+    def test_rollback_leaves_no_file(self):
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                event = self._create_event(self._upload(b'rolled-back-content'))
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(default_storage.exists(event.cover_image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_missing_file_is_written_by_the_next_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_event(self._upload())
+        name = first.cover_image.name
+        # Scrittura fallita dopo il commit: il blob esiste, il file no
+        default_storage.delete(name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_event(self._upload())
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_release_keeps_a_file_acquired_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_event(self._upload())
+        name = first.cover_image.name
+
+        with self.captureOnCommitCallbacks() as release_callbacks:
+            first.delete()
+        # Lo stesso contenuto torna in uso prima che la cancellazione venga eseguita
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self._create_event(self._upload())
+        for callback in release_callbacks:
+            callback()
+
+        self.assertEqual(second.cover_image.name, name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
@@ -2,7 +2,14 @@ from django.contrib import admin
 from django.http import HttpRequest
 
 from .models import Rating
-from .models import Event
+from .models import Event, Participation
+
+
+class ParticipationInline(admin.TabularInline):
+    model = Participation
+    fields = ('user', 'joined_at', 'status')
+    raw_id_fields = ('user',)
+    extra = 0
 
 #admin.site.register(Event)
 @admin.register(Event)
@@ -12,9 +19,9 @@ class EventAdmin(admin.ModelAdmin):
     fieldsets = (
         ('General info', {'fields': ('name', 'description', 'price', 'category', 'tags', 'place', 'created_by', 'max_participants', 'is_private', 'cancelled')}),
         ('Dates', {'fields': ('event_date', 'participation_deadline')}),
-        ('Participants', {'fields': ('joined_by',)}),
         #('Rating', {'fields': ('rating',)}),
     )
+    inlines = [ParticipationInline]
 
     def get_created_by_email(self, obj):
         return obj.created_by.email
@@ -22,6 +29,11 @@ class EventAdmin(admin.ModelAdmin):
     get_created_by_email.short_description = 'Created By Email'
     get_created_by_email.admin_order_field = 'created_by__email'
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # L'inline salva le partecipazioni direttamente: il contatore va ricalcolato
+        Event.objects.filter(pk=form.instance.pk).recount_participants()
+
     def get_readonly_fields(self, request, obj=None):
         if request.user.is_staff or request.user.is_superuser:
                 return [f.name for f in Event._meta.get_fields() if f.name is not 'cancelled']
@@ -0,0 +1,64 @@
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.urls import re_path
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+
+from .caching import acached_response
+
+# Nome della URL -> action di EventViewSet decorata con cached_response
+CACHED_READS = {
+    'events-list-public': 'list_public',
+    'events-search-events': 'search_events',
+    'events-map': 'events_map',
+}
+
+# Accept per cui DRF sceglierebbe comunque JSONRenderer
+JSON_MEDIA_TYPES = ('*/*', 'application/*', 'application/json')
+
+
+def serves_from_cache(request):
+    """
+    Richieste che la view async può servire senza DRF: GET anonime in JSON.
+    Con un token serve l'autenticazione, con un altro formato la content negotiation.
+    """
+    if request.method not in ('GET', 'HEAD') or 'HTTP_AUTHORIZATION' in request.META:
+        return False
+    if 'format' in request.GET:
+        return False
+    accept = request.META.get('HTTP_ACCEPT') or '*/*'
+    return all(media.strip() in JSON_MEDIA_TYPES for media in accept.split(','))
+
+
+def cached_read(view, name):
+    """
+    View async davanti alla view sync del viewset per l'action ``name``: sotto
+    ASGI un hit della cache delle risposte (o un 304) si serve nell'event loop,
+    senza occupare un thread. Miss e tutte le altre richieste passano alla view
+    del viewset, con autenticazione, permessi e serializzazione di DRF.
+    Solo per action AllowAny e senza throttling.
+    """
+    sync_view = sync_to_async(view)
+
+    async def async_view(request, *args, **kwargs):
+        if serves_from_cache(request):
+            response = await acached_response(request, name)
+            if response is not None:
+                # Come finalize_response di APIView con più renderer
+                patch_vary_headers(response, ('Accept',))
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    # cls, initkwargs e actions servono alla generazione dello schema
+    update_wrapper(async_view, view, assigned=(), updated=('__dict__',))
+    return csrf_exempt(async_view)
+
+
+def with_cached_reads(urlpatterns):
+    """URL del router con le action di CACHED_READS servite da cached_read."""
+    return [
+        re_path(pattern.pattern.regex.pattern, cached_read(pattern.callback, CACHED_READS[pattern.name]), name=pattern.name)
+        if pattern.name in CACHED_READS else pattern
+        for pattern in urlpatterns
+    ]
@@ -0,0 +1,165 @@
+import hashlib
+import time
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+VERSION_KEY = 'events:version'
+
+# Hit e miss di questo processo: tenerli nella cache aggiungerebbe una scrittura a ogni richiesta
+response_cache_counts = Counter()
+
+# Colonne che determinano la rappresentazione di un evento nel dettaglio
+EVENT_STATE_FIELDS = ('id', 'last_modified_ts', 'participants_count', 'rating_count', 'rating_sum')
+
+
+def events_version():
+    """Versione globale degli eventi: cambia a ogni scrittura e fa parte della chiave delle risposte."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Se la chiave è stata espulsa si riparte da un valore mai usato,
+        # così le risposte vecchie rimaste in cache non tornano valide
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aevents_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_events_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_events_cache():
+    """
+    Invalida le risposte in cache subito e di nuovo al commit: una lettura
+    concorrente che ha salvato dati vecchi prima del commit viene scartata.
+    """
+    bump_events_version()
+    transaction.on_commit(bump_events_version)
+
+
+def response_cache_stats():
+    """Statistiche del processo che risponde, non dell'intero server."""
+    hits, misses = response_cache_counts['hits'], response_cache_counts['misses']
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'version': events_version(),
+    }
+
+
+def response_cache_key(request, name, version=None):
+    """Chiave per versione, action e parametri normalizzati (ordinati, senza valori vuoti)."""
+    if version is None:
+        version = events_version()
+    params = sorted(
+        (key, value)
+        for key in request.GET
+        for value in request.GET.getlist(key)
+        if value != ''
+    )
+    # Host compreso: i link di paginazione e le immagini sono URL assoluti
+    raw = f'{request.build_absolute_uri(request.path)}?{urlencode(params)}'
+    return f'events:response:{version}:{name}:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+
+def _strong_etag(raw):
+    return '"%s"' % hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def event_etag(request, state):
+    """ETag forte del dettaglio di un evento, dai valori di EVENT_STATE_FIELDS."""
+    raw = ':'.join(str(state[field]) for field in EVENT_STATE_FIELDS)
+    return _strong_etag(f'{raw}:{request.build_absolute_uri()}')
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Risposta 304 (o 412) se le intestazioni condizionali della richiesta
+    corrispondono, altrimenti ``None``. ``last_modified`` è un timestamp.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cached_response(view):
+    """
+    Mette in cache le risposte 200 di un'action GET. Un hit non esegue la
+    query dell'action né serializza; l'header ``X-Cache`` dice se la risposta
+    viene dalla cache.
+    L'ETag deriva dalla chiave, quindi cambia con la versione degli eventi:
+    con ``If-None-Match`` uguale si risponde 304 senza leggere la cache.
+    """
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(request, view.__name__)
+        etag = _strong_etag(key)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        data = cache.get(key)
+        if data is not None:
+            response_cache_counts['hits'] += 1
+            return add_validators(Response(data, headers={'X-Cache': 'HIT'}), etag)
+
+        response_cache_counts['misses'] += 1
+        response = view(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.EVENTS_CACHE_TIMEOUT)
+            add_validators(response, etag)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+
+async def acached_response(request, name):
+    """
+    Per le view async (events.async_views): la risposta in cache dell'action
+    ``name`` come la darebbe cached_response, 304 compreso, già resa in JSON.
+    ``None`` se non è in cache.
+    """
+    key = response_cache_key(request, name, await aevents_version())
+    etag = _strong_etag(key)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    data = await cache.aget(key)
+    if data is None:
+        return None
+    response_cache_counts['hits'] += 1
+    response = HttpResponse(JSONRenderer().render(data), content_type='application/json', headers={'X-Cache': 'HIT'})
+    return add_validators(response, etag)
@@ -0,0 +1,153 @@
+import csv
+import json
+from operator import attrgetter, itemgetter
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from .models import Event, Participation, Rating
+from .serializers import EventSerializer
+
+# Righe lette con una query per giro, e scritte insieme nella risposta
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+EVENT_COLUMNS = (
+    'id', 'name', 'description', 'price', 'category', 'tags', 'place', 'event_date',
+    'participation_deadline', 'creation_ts', 'last_modified_ts', 'created_by_id', 'max_participants',
+    'participants_count', 'rating_count', 'rating_avg', 'is_private', 'cancelled',
+)
+PARTICIPANT_COLUMNS = ('id', 'event_id', 'user_id', 'user__email', 'joined_at', 'status')
+RATING_COLUMNS = ('id', 'event_id', 'user_id', 'rating', 'review', 'created_at')
+
+# Export disponibili: queryset (ordinato sulla chiave primaria) e colonne
+EXPORTS = {
+    'events': (Event.objects.order_by('id'), EVENT_COLUMNS),
+    'participants': (Participation.objects.order_by('id'), PARTICIPANT_COLUMNS),
+    'ratings': (Rating.objects.order_by('id'), RATING_COLUMNS),
+}
+
+# In JSON questi export restano la lista di prima, con la rappresentazione del serializer
+JSON_SERIALIZERS = {
+    'events': (Event.objects.for_listing().order_by('id'), EventSerializer),
+}
+
+
+def export_format(request):
+    """Formato richiesto con ``?output=`` (``json`` se manca)."""
+    output = request.query_params.get('output', 'json').lower()
+    if output not in EXPORT_CONTENT_TYPES:
+        raise ValidationError({'output': f'Unknown format, use one of: {", ".join(EXPORT_CONTENT_TYPES)}'})
+    return output
+
+
+def _chunks(queryset, key):
+    """
+    Il queryset a pezzi di EXPORT_CHUNK_SIZE, in ordine di chiave primaria:
+    ogni pezzo è una query a sé (keyset su ``pk``) e nessun cursore resta
+    aperto tra un pezzo e l'altro, così i pezzi possono arrivare da thread diversi.
+    """
+    after = 0
+    while chunk := list(queryset.filter(pk__gt=after)[:EXPORT_CHUNK_SIZE]):
+        yield chunk
+        after = key(chunk[-1])
+
+
+def _json(pieces):
+    """Lista JSON scritta un pezzo alla volta: ``[``, i pezzi separati da virgole, ``]``."""
+    yield '['
+    separator = ''
+    for piece in pieces:
+        yield separator + piece
+        separator = ','
+    yield ']'
+
+
+def _serialized(chunks, serializer_class, context):
+    renderer = JSONRenderer()
+    for chunk in chunks:
+        # Gli oggetti come li scrive la Response di DRF, senza le parentesi della lista
+        yield renderer.render(serializer_class(chunk, many=True, context=context).data)[1:-1].decode()
+
+
+def _records(chunks, header):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in chunks:
+        yield ','.join(encoder.encode(dict(zip(header, row))) for row in chunk)
+
+
+def _ndjson(chunks, header):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in chunk)
+
+
+class _Echo:
+    """File finto per csv.writer: restituisce la riga invece di scriverla."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, list) else value
+
+
+def _csv(chunks, header):
+    writer = csv.writer(_Echo())
+    # L'intestazione parte subito, prima che il database restituisca le righe
+    yield writer.writerow(header)
+    for chunk in chunks:
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in chunk)
+
+
+def _content(request, name, output, filters):
+    if output == 'json' and name in JSON_SERIALIZERS:
+        queryset, serializer_class = JSON_SERIALIZERS[name]
+        chunks = _chunks(queryset.filter(**filters), attrgetter('pk'))
+        return _json(_serialized(chunks, serializer_class, {'request': request}))
+
+    queryset, columns = EXPORTS[name]
+    header = [column.replace('__', '_') for column in columns]
+    # La prima colonna è sempre ``id``
+    chunks = _chunks(queryset.filter(**filters).values_list(*columns), itemgetter(0))
+    if output == 'json':
+        return _json(_records(chunks, header))
+    return _csv(chunks, header) if output == 'csv' else _ndjson(chunks, header)
+
+
+async def _aiterate(content):
+    """
+    Gli stessi pezzi di ``content``, ciascuno prodotto in un thread: sotto ASGI
+    uno StreamingHttpResponse con un iteratore sync verrebbe letto tutto prima di partire.
+    """
+    next_piece = sync_to_async(next)
+    while (piece := await next_piece(content, None)) is not None:
+        yield piece
+
+
+def export_response(request, name, output, **filters):
+    """
+    Risposta in streaming con tutte le righe dell'export ``name``, in JSON
+    (lista), NDJSON o CSV. Le righe si leggono e si scrivono a pezzi, come
+    tuple senza istanze dei modelli (tranne il JSON degli eventi, che passa dal
+    serializer come prima): la memoria resta costante qualunque sia il numero di righe.
+    """
+    content = _content(request, name, output, filters)
+    if isinstance(request._request, ASGIRequest):
+        content = _aiterate(content)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+    # Niente buffering nei proxy: il client riceve le righe mentre vengono lette
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,190 @@
+import heapq
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from users.models import CustomUser
+from .fieldsets import narrow_queryset
+from .models import Event, Favorite, FeedItem, FeedUpdate, Participation
+
+# Eventi tenuti nella feed di ogni utente
+FEED_SIZE = 200
+# Eventi valutati per utente: quelli compatibili con i suoi gusti, i più vicini nel tempo
+FEED_CANDIDATES = 2000
+# Utenti elaborati insieme (tre query per i gusti di tutto il gruppo)
+FEED_BATCH_SIZE = 500
+
+CITY_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+TAG_WEIGHT = 1.0
+MAX_MATCHING_TAGS = 3
+# Bonus per gli eventi imminenti, dimezzato dopo SOON_DAYS giorni
+SOON_WEIGHT = 0.5
+SOON_DAYS = 7
+
+EVENT_FIELDS = ('id', 'city', 'category', 'tags', 'event_date', 'created_by_id')
+
+
+@dataclass
+class Taste:
+    """Gusti di un utente: la sua città, le categorie dei preferiti e i tag degli eventi a cui partecipa."""
+    city: str = ''  # CustomUser.home_city, confrontabile con Event.city
+    categories: dict = field(default_factory=dict)  # categoria -> quota dei preferiti
+    tags: set = field(default_factory=set)
+
+    def __bool__(self):
+        return bool(self.city or self.categories or self.tags)
+
+
+def batches(values, size=FEED_BATCH_SIZE):
+    values = iter(values)
+    while batch := list(islice(values, size)):
+        yield batch
+
+
+def tastes(user_ids):
+    """Taste degli utenti ``user_ids``, con tre query in tutto."""
+    result = {user_id: Taste() for user_id in user_ids}
+    for user_id, city in CustomUser.objects.filter(id__in=user_ids).values_list('id', 'home_city'):
+        result[user_id].city = city
+
+    favorites = (
+        Favorite.objects.filter(user_id__in=user_ids)
+        .values('user_id', 'event__category').annotate(total=Count('id'))
+        .values_list('user_id', 'event__category', 'total')
+    )
+    totals = {}
+    for user_id, category, total in favorites:
+        result[user_id].categories[category] = total
+        totals[user_id] = totals.get(user_id, 0) + total
+    for user_id, total in totals.items():
+        categories = result[user_id].categories
+        for category in categories:
+            categories[category] /= total
+
+    joined = Participation.objects.filter(user_id__in=user_ids).values_list('user_id', 'event__tags')
+    for user_id, tags in joined:
+        result[user_id].tags.update(tags)
+    return result
+
+
+def score(taste, event, now):
+    """Punteggio di ``event`` (dict con EVENT_FIELDS) per i gusti ``taste``; 0 se non c'entra nulla."""
+    points = CATEGORY_WEIGHT * taste.categories.get(event['category'], 0)
+    if taste.city and event['city'] == taste.city:
+        points += CITY_WEIGHT
+    points += TAG_WEIGHT * min(len(taste.tags.intersection(event['tags'])), MAX_MATCHING_TAGS)
+    if points:
+        days = max((event['event_date'] - now).total_seconds() / 86400, 0)
+        points += SOON_WEIGHT * SOON_DAYS / (SOON_DAYS + days)
+    return points
+
+
+def upcoming_events(now):
+    """Eventi che possono entrare in una feed: pubblici, non annullati e futuri."""
+    return Event.objects.filter(is_private=False, cancelled=False, event_date__gte=now)
+
+
+def candidates(user_id, taste, now):
+    """Eventi futuri compatibili con i gusti, esclusi quelli creati dall'utente o a cui partecipa già."""
+    signals = Q()
+    if taste.city:
+        signals |= Q(city=taste.city)
+    if taste.categories:
+        signals |= Q(category__in=taste.categories)
+    if taste.tags:
+        signals |= Q(tags__overlap=sorted(taste.tags))
+    return (
+        upcoming_events(now).filter(signals).exclude(created_by_id=user_id)
+        .exclude(Event.objects.joined_by_user(user_id))
+        .order_by('event_date', 'id').values(*EVENT_FIELDS)[:FEED_CANDIDATES]
+    )
+
+
+def build_feeds(user_ids, now=None):
+    """
+    Ricalcola da zero la feed degli utenti ``user_ids``: i FEED_SIZE eventi
+    con il punteggio più alto. Restituisce il numero di FeedItem scritte.
+    """
+    now = now or timezone.now()
+    items = []
+    for user_id, taste in tastes(user_ids).items():
+        if not taste:
+            continue
+        scored = ((score(taste, event, now), event) for event in candidates(user_id, taste, now))
+        items.extend(
+            FeedItem(user_id=user_id, event_id=event['id'], score=points, event_date=event['event_date'])
+            for points, event in heapq.nlargest(FEED_SIZE, scored, key=lambda pair: pair[0])
+            if points > 0
+        )
+    with transaction.atomic():
+        FeedItem.objects.filter(user_id__in=user_ids).delete()
+        FeedItem.objects.bulk_create(items, batch_size=1000)
+    return len(items)
+
+
+def add_event_to_feeds(event_id, now=None):
+    """
+    Aggiunge un nuovo evento alle feed degli utenti interessati (stessa città,
+    categoria tra i preferiti o tag degli eventi a cui partecipano), senza
+    ricalcolarle. Solo utenti che hanno già una feed: gli altri la ricevono
+    con build_feeds. Una feed può superare FEED_SIZE fino al ricalcolo successivo.
+    """
+    now = now or timezone.now()
+    event = upcoming_events(now).filter(pk=event_id).values(*EVENT_FIELDS).first()
+    if event is None:
+        return 0
+
+    # Una query per segnale, ciascuna servita da un indice (OR sugli utenti sarebbe una scansione)
+    interested = set()
+    if event['city']:
+        interested.update(CustomUser.objects.filter(home_city=event['city']).values_list('id', flat=True))
+    if event['category'] is not None:
+        interested.update(Favorite.objects.filter(event__category=event['category']).values_list('user_id', flat=True))
+    if event['tags']:
+        interested.update(Participation.objects.filter(event__tags__overlap=event['tags']).values_list('user_id', flat=True))
+    interested.discard(event['created_by_id'])
+
+    added = 0
+    for user_ids in batches(sorted(interested)):
+        with_feed = FeedItem.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True).distinct()
+        items = [
+            FeedItem(user_id=user_id, event_id=event['id'], score=points, event_date=event['event_date'])
+            for user_id, taste in tastes(list(with_feed)).items()
+            if (points := score(taste, event, now)) > 0
+        ]
+        added += len(FeedItem.objects.bulk_create(items, ignore_conflicts=True))
+    return added
+
+
+def process_feed_updates(batch_size=FEED_BATCH_SIZE):
+    """
+    Esegue un lotto di FeedUpdate accodati da iscrizioni e nuovi eventi e lo
+    toglie dalla coda nella stessa transazione: se qualcosa fallisce il lotto
+    resta in coda. Ricalcoli dello stesso utente e aggiunte dello stesso evento
+    si fanno una volta sola. Restituisce il numero di aggiornamenti presi.
+    """
+    with transaction.atomic():
+        batch = FeedUpdate.objects.claim(batch_size)
+        user_ids = sorted({update.target_id for update in batch if update.kind == FeedUpdate.Kind.USER})
+        event_ids = sorted({update.target_id for update in batch if update.kind == FeedUpdate.Kind.EVENT})
+        if user_ids:
+            build_feeds(user_ids)
+        for event_id in event_ids:
+            add_event_to_feeds(event_id)
+        FeedUpdate.objects.filter(pk__in=[update.pk for update in batch]).delete()
+    return len(batch)
+
+
+def feed_items(user_id, now=None):
+    """FeedItem future dell'utente in ordine di punteggio: un range scan su feed_user_score_idx."""
+    return FeedItem.objects.filter(user_id=user_id, event_date__gte=now or timezone.now()).order_by('-score', 'event_date', 'id')
+
+
+def feed_events(items, fields=None):
+    """Eventi delle FeedItem di una pagina, nello stesso ordine, con una lookup per chiave primaria."""
+    events = narrow_queryset(Event.objects.for_listing(), fields).in_bulk([item.event_id for item in items])
+    return [events[item.event_id] for item in items if item.event_id in events]
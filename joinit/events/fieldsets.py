@@ -0,0 +1,51 @@
+from functools import cache
+
+from rest_framework.exceptions import ValidationError
+
+from .models import Event, EventQuerySet
+from .serializers import EventSerializer
+
+# Campi mostrati dalle card delle liste (?view=card)
+CARD_FIELDS = [
+    'id', 'name', 'event_date', 'participation_deadline', 'place', 'price', 'category',
+    'cover_image', 'is_private', 'cancelled', 'created_by', 'max_participants',
+    'participants_count', 'rating_avg', 'rating_count',
+]
+
+
+@cache
+def event_field_names():
+    return frozenset(EventSerializer().fields)
+
+
+def requested_fields(request):
+    """
+    Campi dell'evento richiesti con ``?view=card`` o ``?fields=a,b,c``;
+    ``None`` se la risposta deve contenere l'evento completo.
+    """
+    params = request.query_params
+    if params.get('view') == 'card':
+        return list(CARD_FIELDS)
+    if not params.get('fields', '').strip():
+        return None
+
+    fields = list(dict.fromkeys(name.strip() for name in params['fields'].split(',') if name.strip()))
+    unknown = [name for name in fields if name not in event_field_names()]
+    if unknown:
+        raise ValidationError({'fields': f'Unknown fields: {", ".join(unknown)}'})
+    return fields
+
+
+def narrow_queryset(queryset, fields):
+    """
+    Carica solo le colonne dei campi richiesti (più le chiavi di ordinamento,
+    usate dalla paginazione a cursore) e solo le relazioni che verranno serializzate.
+    """
+    if fields is None:
+        return queryset
+
+    columns = {field.name for field in Event._meta.concrete_fields}
+    ordering = [name.lstrip('-') for name in queryset.query.order_by if isinstance(name, str)]
+    only = [name for name in dict.fromkeys([*fields, *ordering]) if name in columns]
+    prefetches = [prefetch for prefetch in EventQuerySet.listing_prefetches() if prefetch.prefetch_to in fields]
+    return queryset.prefetch_related(None).prefetch_related(*prefetches).only('id', *only)
@@ -0,0 +1,103 @@
+import csv
+import math
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer_it.csv'
+EARTH_RADIUS_KM = 6371.0
+COUNTRIES = {'italia': 'Italia', 'italy': 'Italia', 'it': 'Italia'}
+# Parti dell'indirizzo che non sono mai una città
+STREET_PREFIXES = ('via', 'viale', 'piazza', 'piazzale', 'corso', 'largo', 'vicolo', 'strada', 'contrada', 'lungomare')
+
+_POSTCODE_RE = re.compile(r'\b\d{5}\b|\(\w{2}\)')
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+@dataclass(frozen=True)
+class Location:
+    city: str = ''
+    region: str = ''
+    country: str = ''
+    latitude: float | None = None
+    longitude: float | None = None
+
+
+def normalize(text):
+    """Chiave di confronto: minuscolo, senza accenti, punteggiatura, CAP e sigla della provincia."""
+    text = unicodedata.normalize('NFKD', _POSTCODE_RE.sub(' ', text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD_RE.sub(' ', text.casefold()).strip()
+
+
+@cache
+def gazetteer():
+    """Città del gazetteer incluso nel repository (data/gazetteer_it.csv), per nome normalizzato."""
+    places = {}
+    with open(GAZETTEER_PATH, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            location = Location(
+                row['city'], row['region'], row['country'], float(row['latitude']), float(row['longitude']),
+            )
+            for name in [row['city'], *filter(None, row['aliases'].split('|'))]:
+                places[normalize(name)] = location
+    return places
+
+
+@cache
+def regions():
+    return {normalize(location.region): location.region for location in gazetteer().values()}
+
+
+def locate(place):
+    """
+    Città, regione, nazione e coordinate di un indirizzo in testo libero come
+    "Via del Mare, 1, Napoli, Campania, Italia", senza servizi esterni.
+    Le parti si leggono da destra; una città fuori dal gazetteer viene
+    riconosciuta dalla posizione, ma resta senza coordinate.
+    """
+    city = region = country = ''
+    for part in reversed([part.strip() for part in (place or '').split(',')]):
+        key = normalize(part)
+        if not key:
+            continue
+        if not country and key in COUNTRIES:
+            country = COUNTRIES[key]
+        elif not region and key in regions():
+            region = regions()[key]
+        elif key in gazetteer():
+            found = gazetteer()[key]
+            return Location(found.city, region or found.region, country or found.country, found.latitude, found.longitude)
+        elif not city and not key[0].isdigit() and key.split()[0] not in STREET_PREFIXES:
+            city = part
+            break
+    return Location(city, region, country)
+
+
+def canonical_city(city):
+    """Nome della città scritta da un utente come in Event.city (``Naples`` -> ``Napoli``)."""
+    city = (city or '').strip()
+    return locate(city).city if city else ''
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(lat min, lat max, lon min, lon max) del quadrato che contiene il cerchio di raggio ``radius_km``."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180)
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def distance_km(latitude, longitude):
+    """Espressione SQL della distanza (haversine) in km dalle coordinate dell'evento."""
+    lat, lon = Value(latitude, FloatField()), Value(longitude, FloatField())
+    half_chord = (
+        Power(Sin((Radians(F('latitude')) - Radians(lat)) / 2), 2)
+        + Cos(Radians(lat)) * Cos(Radians(F('latitude'))) * Power(Sin((Radians(F('longitude')) - Radians(lon)) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(half_chord))
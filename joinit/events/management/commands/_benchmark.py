@@ -0,0 +1,129 @@
+"""
+Utility condivise dai comandi benchmark_*: popolano il database con dati
+sintetici dentro una transazione che viene sempre annullata a fine misura.
+"""
+from django.db import connection, transaction
+
+from events.geo import locate
+from events.models import empty_rating_histogram
+
+CITIES = [
+    ('Napoli', 'Campania'), ('Roma', 'Lazio'), ('Milano', 'Lombardia'), ('Torino', 'Piemonte'),
+    ('Bologna', 'Emilia-Romagna'), ('Firenze', 'Toscana'), ('Bari', 'Puglia'), ('Palermo', 'Sicilia'),
+    ('Genova', 'Liguria'), ('Venezia', 'Veneto'), ('Cagliari', 'Sardegna'), ('Trieste', 'Friuli-Venezia Giulia'),
+]
+WORDS = [
+    'concerto', 'mostra', 'festa', 'torneo', 'corso', 'sagra', 'teatro', 'cinema', 'maratona',
+    'degustazione', 'laboratorio', 'conferenza', 'mercatino', 'visita', 'escursione', 'jazz',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class seeded_database:
+    """Context manager: apre una transazione, esegue ``seed`` e fa sempre rollback all'uscita."""
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def __enter__(self):
+        self.atomic = transaction.atomic()
+        self.atomic.__enter__()
+        self.seed()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.atomic.__exit__(Rollback, Rollback(), None)
+        return exc_type is Rollback
+
+
+def seed_users(count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO users_customuser (
+                password, is_superuser, is_staff, is_active, date_joined, email,
+                first_name, last_name, can_join, can_post, can_comment, created_at, updated_at
+            )
+            SELECT '!', false, false, true, now(), 'bench' || i || '@joinit.it',
+                   'Nome' || i, 'Cognome' || (i %% 5000), true, true, true, now(), now()
+            FROM generate_series(1, %s) AS i
+            """,
+            [count],
+        )
+
+
+def seed_events(count):
+    """Crea ``count`` eventi distribuiti su città, categorie e date diverse."""
+    places = [f'Via Roma, {i}, {city}, {region}, Italia' for i, (city, region) in enumerate(CITIES, 1)]
+    locations = [locate(place) for place in places]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(id) FROM users_customuser WHERE email LIKE 'bench%%@joinit.it'")
+        first_user = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            INSERT INTO events_event (
+                name, description, price, category, tags, place, city, region, country,
+                latitude, longitude, event_date, creation_ts,
+                last_modified_ts, participation_deadline, created_by_id, max_participants,
+                cover_image, is_private, cancelled, participants_count,
+                rating_count, rating_sum, rating_avg, rating_histogram
+            )
+            SELECT initcap((%(words)s::text[])[1 + i %% %(n_words)s]) || ' ' || i,
+                   'Evento di prova numero ' || i,
+                   (i %% 50)::numeric, i %% 10,
+                   ARRAY[(%(words)s::text[])[1 + i %% %(n_words)s], (%(words)s::text[])[1 + (i / 7) %% %(n_words)s]],
+                   (%(places)s::text[])[1 + i %% %(n_places)s],
+                   (%(cities)s::text[])[1 + i %% %(n_places)s],
+                   (%(regions)s::text[])[1 + i %% %(n_places)s],
+                   (%(countries)s::text[])[1 + i %% %(n_places)s],
+                   (%(latitudes)s::float8[])[1 + i %% %(n_places)s],
+                   (%(longitudes)s::float8[])[1 + i %% %(n_places)s],
+                   now() + (i %% 720 - 360) * interval '1 day', now(), now(),
+                   now() + (i %% 720 - 361) * interval '1 day',
+                   %(first_user)s, 20, '', i %% 10 = 0, i %% 50 = 0, 0,
+                   0, 0, 0, %(histogram)s
+            FROM generate_series(1, %(count)s) AS i
+            """,
+            {
+                'words': WORDS, 'n_words': len(WORDS), 'places': places, 'n_places': len(places),
+                'cities': [location.city for location in locations],
+                'regions': [location.region for location in locations],
+                'countries': [location.country for location in locations],
+                'latitudes': [location.latitude for location in locations],
+                'longitudes': [location.longitude for location in locations],
+                'histogram': empty_rating_histogram(), 'first_user': first_user, 'count': count,
+            },
+        )
+
+
+def explain(queryset):
+    return queryset.explain(analyze=True, buffers=True)
+
+
+def seed_participations(per_user):
+    """Ogni utente di benchmark partecipa a ``per_user`` eventi distinti."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(id), count(*) FROM events_event')
+        first_event, total = cursor.fetchone()
+        cursor.execute(
+            """
+            INSERT INTO events_event_joined_by (event_id, customuser_id, joined_at, status)
+            SELECT %s + (u.id * 37 + k * 997) %% %s, u.id, now(), 'joined'
+            FROM users_customuser AS u
+            CROSS JOIN generate_series(1, %s) AS k
+            WHERE u.email LIKE 'bench%%@joinit.it'
+            ON CONFLICT DO NOTHING
+            """,
+            [first_event, total, per_user],
+        )
+
+
+def bench_user_id():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(id) FROM users_customuser WHERE email LIKE 'bench%%@joinit.it'")
+        return cursor.fetchone()[0]
@@ -0,0 +1,153 @@
+import http.client
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.models import Event
+
+SERVERS = {
+    # Gli hit della cache delle liste (events.async_views) nell'event loop, il resto in un thread
+    'asgi': ('uvicorn', lambda port, options: [
+        sys.executable, '-m', 'uvicorn', 'joinit.asgi:application', '--port', str(port),
+        '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+    ]),
+    # gthread: ogni worker serve fino a --threads richieste alla volta
+    'wsgi': ('gunicorn', lambda port, options: [
+        sys.executable, '-m', 'gunicorn', 'joinit.wsgi:application', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(options['workers']), '--worker-class', 'gthread',
+        '--threads', str(options['threads']), '--log-level', 'warning',
+    ]),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta il throughput delle letture pubbliche sotto un server ASGI (uvicorn) e "
+        "WSGI (gunicorn) con molte connessioni concorrenti. Usa i dati del database "
+        "configurato: conviene un database di sviluppo già popolato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+        parser.add_argument('--concurrency', type=int, default=50, help='Connessioni keep-alive aperte insieme.')
+        parser.add_argument('--requests', type=int, default=2000, help='Richieste per server.')
+        parser.add_argument('--workers', type=int, default=1, help='Processi del server.')
+        parser.add_argument('--threads', type=int, default=8, help='Thread per worker di gunicorn.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--path', action='append', dest='paths', help='URL da chiamare a rotazione (ripetibile).')
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Lascia attiva la cache delle risposte (di default si misurano le view, con DummyCache).',
+        )
+
+    def handle(self, *args, **options):
+        for name in options['servers']:
+            module = SERVERS[name][0]
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'{module} non è installato: pip install -r requirements.txt')
+
+        paths = options['paths'] or self.default_paths()
+        env = dict(os.environ)
+        if not options['with_cache']:
+            env['CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+        self.stdout.write(f"{options['requests']} richieste, {options['concurrency']} connessioni, URL: {', '.join(paths)}")
+        for name in options['servers']:
+            with running_server(SERVERS[name][1](options['port'], options), options['port'], env):
+                load(options['port'], paths, options['concurrency'], options['requests'] // 10)  # riscaldamento
+                result = load(options['port'], paths, options['concurrency'], options['requests'])
+            self.report(name, result)
+
+    def default_paths(self):
+        event_id = Event.objects.filter(is_private=False).order_by('-id').values_list('id', flat=True).first()
+        if event_id is None:
+            raise CommandError('Nessun evento pubblico nel database: popolalo prima di misurare.')
+        return [
+            '/api/v1/events/list_public/',
+            '/api/v1/events/search/?q=concerto',
+            f'/api/v1/events/{event_id}/',
+            f'/api/v1/events/{event_id}/ratings/',
+        ]
+
+    def report(self, name, result):
+        latencies, errors, elapsed = result
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {name} ==='))
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'Nessuna risposta riuscita ({errors} errori)'))
+            return
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{len(latencies) / elapsed:.0f} richieste/s, errori: {errors}\n'
+            f'latenza ms: p50 {quantiles[49] * 1000:.1f}, p95 {quantiles[94] * 1000:.1f}, p99 {quantiles[98] * 1000:.1f}'
+        )
+
+
+class running_server:
+    """Context manager: avvia il server in un sottoprocesso e aspetta che risponda."""
+
+    def __init__(self, command, port, env=None, timeout=30):
+        self.command = command
+        self.port = port
+        self.env = env
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=settings.BASE_DIR, env=self.env)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'Il server è terminato all\'avvio: {" ".join(self.command)}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=1)
+                connection.request('GET', '/api/v1/events/event_types/')
+                connection.getresponse().read()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise CommandError(f'Il server non risponde sulla porta {self.port}')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def load(port, paths, concurrency, total):
+    """Esegue ``total`` GET su ``concurrency`` connessioni; restituisce latenze, errori e durata."""
+    per_client = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+
+    def client(index):
+        latencies, errors = [], 0
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        for path in islice(cycle(paths[index % len(paths):] + paths[:index % len(paths)]), per_client[index]):
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                continue
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        connection.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return [latency for latencies, _ in results for latency in latencies], sum(errors for _, errors in results), elapsed
@@ -0,0 +1,69 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from joinit.db.pool import close_pools, pool_stats
+
+QUERY = 'SELECT id, name, participants_count FROM events_event ORDER BY id DESC LIMIT 1'
+
+
+class Command(BaseCommand):
+    help = (
+        "Misura il costo per richiesta della connessione al database: apertura, una query "
+        "e chiusura come fa ogni richiesta con CONN_MAX_AGE = 0, con una connessione nuova "
+        "ogni volta e con il pool di joinit.db."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Richieste simulate per modalità.')
+        parser.add_argument('--threads', type=int, default=8, help='Richieste concorrenti.')
+        parser.add_argument('--max-size', type=int, default=4, help='Dimensione massima del pool.')
+
+    def handle(self, *args, **options):
+        settings_dict = connections['default'].settings_dict
+        pooled = {
+            **settings_dict,
+            'OPTIONS': {**settings_dict['OPTIONS'], 'pool': {'min_size': 0, 'max_size': options['max_size']}},
+        }
+        plain = {**settings_dict, 'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {
+            name: value for name, value in settings_dict['OPTIONS'].items() if name != 'pool'
+        }}
+
+        for label, settings in (('connessione nuova', plain), ('pool', pooled)):
+            close_pools()
+            latencies, elapsed, stats = run(settings, options['requests'], options['threads'])
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {label} ==='))
+            self.stdout.write(
+                f'{len(latencies) / elapsed:.0f} richieste/s, latenza ms: media {statistics.fmean(latencies) * 1000:.2f}, '
+                f'p50 {quantiles[49] * 1000:.2f}, p95 {quantiles[94] * 1000:.2f}'
+            )
+            for pool in stats if settings is pooled else []:
+                self.stdout.write(
+                    f"pool: {pool['connections_opened']} connessioni aperte per {pool['checkouts']} prelievi, "
+                    f"{pool['waits']} attese (media {pool['wait_avg_ms']} ms, max {pool['wait_max_ms']} ms)"
+                )
+        close_pools()
+
+
+def run(settings_dict, requests, threads):
+    backend = load_backend(settings_dict['ENGINE'])
+
+    def request(_):
+        # Un wrapper per thread, come le connessioni di Django
+        wrapper = backend.DatabaseWrapper(settings_dict)
+        start = time.perf_counter()
+        with wrapper.cursor() as cursor:
+            cursor.execute(QUERY)
+            cursor.fetchall()
+        wrapper.close()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = list(executor.map(request, range(requests)))
+    return latencies, time.perf_counter() - start, pool_stats()
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from events.models import Event
+from events.search import contains_filter, fuzzy_threshold
+from users.models import CustomUser
+
+from ._benchmark import explain, seed_events, seed_users, seeded_database
+
+TRIGRAM_INDEXES = ['event_name_trgm_idx', 'event_place_trgm_idx', 'user_last_name_trgm_idx']
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta i piani di esecuzione dei filtri place/name/last_name con e senza "
+        "gli indici trigram su un dataset sintetico. Tutto avviene in una transazione "
+        "annullata alla fine: non usare su un database in produzione (DROP INDEX blocca la tabella)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        def seed():
+            seed_users(options['users'])
+            seed_events(options['events'])
+
+        queries = {
+            'place icontains "napoli"': lambda: Event.objects.filter(contains_filter('place', 'napoli')),
+            'name icontains "festa 4242"': lambda: Event.objects.filter(contains_filter('name', 'festa 4242')),
+            'place fuzzy "Napli"': lambda: Event.objects.filter(contains_filter('place', 'Napli', fuzzy=True)),
+            'last_name icontains "cognome4242"': lambda: CustomUser.objects.filter(contains_filter('last_name', 'cognome4242')),
+        }
+
+        with seeded_database(seed), fuzzy_threshold():
+            savepoint = transaction.savepoint()
+            with connection.cursor() as cursor:
+                for index in TRIGRAM_INDEXES:
+                    cursor.execute(f'DROP INDEX {index}')
+            before = {label: explain(build()) for label, build in queries.items()}
+            transaction.savepoint_rollback(savepoint)
+            after = {label: explain(build()) for label, build in queries.items()}
+
+        for label in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {label} ==='))
+            self.stdout.write(self.style.WARNING('--- senza indici trigram ---'))
+            self.stdout.write(before[label])
+            self.stdout.write(self.style.SUCCESS('--- con indici trigram ---'))
+            self.stdout.write(after[label])
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from events.models import Event, Participation
+
+from ._benchmark import bench_user_id, explain, seed_events, seed_participations, seed_users, seeded_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta il filtro di visibilità di list_public con JOIN + DISTINCT e con EXISTS "
+        "su un dataset sintetico (default: 100k eventi, 1M partecipazioni), in una "
+        "transazione annullata alla fine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--participations-per-user', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        def seed():
+            seed_users(options['users'])
+            seed_events(options['events'])
+            seed_participations(options['participations_per_user'])
+
+        with seeded_database(seed):
+            user_id = bench_user_id()
+            participations = Participation.objects.count()
+            shapes = {
+                'JOIN + DISTINCT': Event.objects.filter(
+                    Q(is_private=False, cancelled=False) | Q(is_private=True, joined_by__id=user_id)
+                ).distinct().order_by('-event_date', '-id'),
+                'EXISTS': Event.objects.listed_for(user_id).order_by('-event_date', '-id'),
+            }
+            limit = options['page_size'] + 1
+            results = {
+                label: (explain(queryset[:limit]), explain_count(queryset))
+                for label, queryset in shapes.items()
+            }
+
+        self.stdout.write(f"{options['events']} eventi, {participations} partecipazioni, userId={user_id}")
+        for label, (page_plan, count_plan) in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {label}: prima pagina ==='))
+            self.stdout.write(page_plan)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'=== {label}: COUNT(*) ==='))
+            self.stdout.write(count_plan)
+
+
+def explain_count(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) SELECT COUNT(*) FROM ({sql}) AS subquery', params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
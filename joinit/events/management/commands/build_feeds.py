@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events.feeds import FEED_BATCH_SIZE, batches, build_feeds
+from events.models import FeedItem
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola le feed personalizzate della home (events.feeds) e toglie gli "
+        "eventi passati. Da eseguire periodicamente, ad esempio ogni notte: tra "
+        "un ricalcolo e l'altro nuovi eventi e iscrizioni arrivano con process_feed_updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', type=int, help='Solo questi utenti (id).')
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired, _ = FeedItem.objects.filter(event_date__lt=now).delete()
+
+        users = CustomUser.objects.filter(is_active=True)
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+        user_ids = users.order_by('pk').values_list('pk', flat=True).iterator()
+
+        total_users = total_items = 0
+        for batch in batches(user_ids, options['batch_size']):
+            total_items += build_feeds(batch, now)
+            total_users += len(batch)
+            self.stdout.write(f'{total_users} utenti, {total_items} eventi in feed', ending='\r')
+        self.stdout.write(self.style.SUCCESS(
+            f'Feed ricalcolate per {total_users} utenti: {total_items} eventi, {expired} eventi passati rimossi.'
+        ))
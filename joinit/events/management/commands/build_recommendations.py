@@ -0,0 +1,32 @@
+import importlib.util
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola gli eventi simili di /events/{id}/recommended/ dalle partecipazioni "
+        "e dai preferiti in comune (events.recommendations). Da eseguire periodicamente "
+        "fuori dalle richieste, ad esempio ogni notte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None, help='Vicini salvati per evento.')
+        parser.add_argument('--block-size', type=int, default=None, help='Eventi elaborati insieme.')
+
+    def handle(self, *args, **options):
+        for module in ('numpy', 'scipy'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'{module} non è installato: pip install -r requirements.txt')
+        from events import recommendations
+
+        start = time.perf_counter()
+        stats = recommendations.build_recommendations(
+            top_k=options['top_k'] or recommendations.RECOMMENDATION_TOP_K,
+            block_size=options['block_size'] or recommendations.SIMILARITY_BLOCK_SIZE,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['neighbours']} vicini per {stats['events']} eventi da {stats['interactions']} "
+            f"interazioni in {time.perf_counter() - start:.1f}s"
+        ))
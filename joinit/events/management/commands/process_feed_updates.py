@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.feeds import FEED_BATCH_SIZE, process_feed_updates
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue gli aggiornamenti delle feed accodati da iscrizioni e nuovi eventi "
+        "(FeedUpdate), a lotti e fuori dalle richieste. Più worker si dividono la coda."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE, help='Aggiornamenti bloccati ed eseguiti per lotto.')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Secondi di attesa quando la coda è vuota.')
+        parser.add_argument('--once', action='store_true', help='Svuota la coda e termina invece di restare in ascolto.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                claimed = process_feed_updates(options['batch_size'])
+                processed += claimed
+                if claimed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Aggiornamenti delle feed eseguiti: {processed}')
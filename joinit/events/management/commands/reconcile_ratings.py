@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from events.caching import invalidate_events_cache
+from events.models import RATING_BUCKETS
+
+HISTOGRAM = ',\n'.join(
+    f'count(r.id) FILTER (WHERE r.rating = {bucket / 2})' for bucket in range(RATING_BUCKETS)
+)
+
+# Aggregati ricalcolati da events_rating, solo per gli eventi che non tornano
+DRIFTED = f"""
+SELECT e.id, s.rating_count, s.rating_sum, s.rating_avg, s.rating_histogram
+FROM events_event e
+JOIN (
+    SELECT e.id,
+           count(r.id) AS rating_count,
+           coalesce(sum(r.rating), 0) AS rating_sum,
+           coalesce(round(avg(r.rating), 2), 0) AS rating_avg,
+           ARRAY[{HISTOGRAM}]::integer[] AS rating_histogram
+    FROM events_event e
+    LEFT JOIN events_rating r ON r.event_id = e.id
+    GROUP BY e.id
+) s ON s.id = e.id
+WHERE (e.rating_count, e.rating_sum, e.rating_avg, e.rating_histogram)
+    IS DISTINCT FROM (s.rating_count, s.rating_sum, s.rating_avg, s.rating_histogram)
+"""
+
+RECONCILE = f"""
+WITH drifted AS ({DRIFTED})
+UPDATE events_event e
+SET rating_count = d.rating_count,
+    rating_sum = d.rating_sum,
+    rating_avg = d.rating_avg,
+    rating_histogram = d.rating_histogram
+FROM drifted d
+WHERE d.id = e.id
+RETURNING e.id
+"""
+
+
+class Command(BaseCommand):
+    help = "Ricalcola gli aggregati dei voti degli eventi (media, conteggio, istogramma) dove non corrispondono a events_rating."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Mostra gli eventi da correggere senza modificarli.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DRIFTED if options['dry_run'] else RECONCILE)
+            event_ids = sorted(row[0] for row in cursor.fetchall())
+            if event_ids and not options['dry_run']:
+                invalidate_events_cache()
+
+        verb = 'da correggere' if options['dry_run'] else 'corretti'
+        self.stdout.write(f'Eventi {verb}: {len(event_ids)}')
+        if event_ids and options['verbosity'] > 1:
+            self.stdout.write('  ' + ', '.join(map(str, event_ids)))
@@ -0,0 +1,83 @@
+import math
+
+from django.db.models import Avg, Count, F, Min
+from django.db.models.functions import Floor
+from rest_framework.exceptions import ValidationError
+
+from .models import Event
+
+MAP_MAX_ZOOM = 20
+# Celle della griglia per lato di una tile da 256 px: un cluster ogni 64 px circa
+MAP_CELLS_PER_TILE = 4
+# Oltre questo numero di celle nel viewport la griglia si allarga
+MAP_MAX_CELLS = 1024
+
+
+def map_params(params):
+    """
+    ``bbox=ovest,sud,est,nord`` (gradi) e ``zoom`` (0-20) della mappa, e
+    l'eventuale ``userId``. Il viewport non può attraversare l'antimeridiano.
+    """
+    try:
+        west, south, east, north = (float(value) for value in params.get('bbox', '').split(','))
+    except ValueError:
+        raise ValidationError({'bbox': 'Expected "west,south,east,north".'})
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise ValidationError({'bbox': 'Coordinates out of range.'})
+    zoom = params.get('zoom', '')
+    if not zoom.isdigit() or int(zoom) > MAP_MAX_ZOOM:
+        raise ValidationError({'zoom': f'Must be an integer between 0 and {MAP_MAX_ZOOM}.'})
+    user_id = params.get('userId', '')
+    if user_id and not user_id.isdigit():
+        raise ValidationError({'userId': 'Must be a user id.'})
+    return (west, south, east, north), int(zoom), int(user_id) if user_id else None
+
+
+def cell_size(bbox, zoom):
+    """
+    Lato in gradi delle celle allo ``zoom`` dato, raddoppiato finché il
+    viewport contiene al più MAP_MAX_CELLS celle.
+    """
+    west, south, east, north = bbox
+    size = 360 / (2 ** zoom * MAP_CELLS_PER_TILE)
+    while math.ceil((east - west) / size) * math.ceil((north - south) / size) > MAP_MAX_CELLS:
+        size *= 2
+    return size
+
+
+def map_clusters(params):
+    """
+    Cluster degli eventi visibili come in list_public (``userId``) nel viewport:
+    un GROUP BY sulla cella della griglia, con numero di eventi e baricentro.
+    La griglia è allineata a (0, 0), così i cluster non cambiano spostando la mappa.
+    Restituisce lato della cella e queryset di dict (cell_x, cell_y, count, lat, lon, event_id).
+    """
+    bbox, zoom, user_id = map_params(params)
+    west, south, east, north = bbox
+    size = cell_size(bbox, zoom)
+    clusters = (
+        Event.objects.listed_for(user_id)
+        .filter(latitude__range=(south, north), longitude__range=(west, east))
+        .annotate(cell_x=Floor(F('longitude') / size), cell_y=Floor(F('latitude') / size))
+        .values('cell_x', 'cell_y')
+        .annotate(count=Count('id'), lat=Avg('latitude'), lon=Avg('longitude'), event_id=Min('id'))
+        .order_by('cell_y', 'cell_x')
+    )
+    return size, clusters
+
+
+def map_payload(params, size, clusters):
+    """Risposta di /events/map/: ``event`` è l'id dell'evento per i cluster di uno solo."""
+    return {
+        'zoom': int(params['zoom']),
+        'cell_size': size,
+        'clusters': [
+            {
+                'latitude': round(cluster['lat'], 6),
+                'longitude': round(cluster['lon'], 6),
+                'count': cluster['count'],
+                'event': cluster['event_id'] if cluster['count'] == 1 else None,
+            }
+            for cluster in clusters
+        ],
+    }
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_alter_event_joined_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='cover_image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+    ]
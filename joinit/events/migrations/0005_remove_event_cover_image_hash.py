@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_event_cover_image_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='event',
+            name='cover_image_hash',
+        ),
+    ]
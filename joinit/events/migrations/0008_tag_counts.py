@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:37
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+NORMALIZE_TAGS = """
+UPDATE events_event SET tags = ARRAY(
+    SELECT tag FROM (
+        SELECT lower(btrim(t)) AS tag, min(position) AS position
+        FROM unnest(tags) WITH ORDINALITY AS u(t, position)
+        WHERE btrim(t) <> ''
+        GROUP BY 1
+    ) AS normalized
+    ORDER BY position
+)
+WHERE tags <> '{}';
+"""
+
+POPULATE_TAG_COUNTS = """
+INSERT INTO events_tagcount (tag, event_count)
+SELECT tag, count(*)
+FROM events_event, unnest(tags) AS tag
+WHERE NOT is_private AND NOT cancelled
+GROUP BY tag;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('event_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tags'], name='event_tags_gin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagcount',
+            index=models.Index(fields=['-event_count', 'tag'], name='tagcount_popular_idx'),
+        ),
+        migrations.RunSQL(NORMALIZE_TAGS, migrations.RunSQL.noop),
+        migrations.RunSQL(POPULATE_TAG_COUNTS, migrations.RunSQL.noop),
+    ]
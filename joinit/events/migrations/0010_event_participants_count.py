@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+POPULATE_PARTICIPANTS_COUNT = """
+UPDATE events_event e
+SET participants_count = j.total
+FROM (
+    SELECT event_id, count(*) AS total
+    FROM events_event_joined_by
+    GROUP BY event_id
+) j
+WHERE j.event_id = e.id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='participants_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(POPULATE_PARTICIPANTS_COUNT, migrations.RunSQL.noop),
+    ]
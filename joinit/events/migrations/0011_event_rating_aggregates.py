@@ -0,0 +1,70 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:50
+
+import django.contrib.postgres.fields
+import events.models
+from django.db import migrations, models
+
+
+POPULATE_RATING_AGGREGATES = """
+UPDATE events_event e
+SET rating_count = s.rating_count,
+    rating_sum = s.rating_sum,
+    rating_avg = s.rating_avg,
+    rating_histogram = s.rating_histogram
+FROM (
+    SELECT event_id,
+           count(*) AS rating_count,
+           sum(rating) AS rating_sum,
+           round(avg(rating), 2) AS rating_avg,
+           ARRAY[
+               count(*) FILTER (WHERE rating = 0.0),
+               count(*) FILTER (WHERE rating = 0.5),
+               count(*) FILTER (WHERE rating = 1.0),
+               count(*) FILTER (WHERE rating = 1.5),
+               count(*) FILTER (WHERE rating = 2.0),
+               count(*) FILTER (WHERE rating = 2.5),
+               count(*) FILTER (WHERE rating = 3.0),
+               count(*) FILTER (WHERE rating = 3.5),
+               count(*) FILTER (WHERE rating = 4.0),
+               count(*) FILTER (WHERE rating = 4.5),
+               count(*) FILTER (WHERE rating = 5.0)
+           ]::integer[] AS rating_histogram
+    FROM events_rating
+    GROUP BY event_id
+) s
+WHERE s.event_id = e.id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0010_event_participants_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_histogram',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=events.models.empty_rating_histogram, editable=False, size=11),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=9),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='event_rating_idx'),
+        ),
+        migrations.RunSQL(POPULATE_RATING_AGGREGATES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0011_event_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='events.event'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# La tabella esiste già (M2M implicita di joined_by): si aggiungono solo le
+# nuove colonne. Per le partecipazioni esistenti la data di iscrizione non è
+# nota e si usa quella di creazione dell'evento.
+ADD_COLUMNS = """
+ALTER TABLE events_event_joined_by
+    ADD COLUMN joined_at timestamp with time zone,
+    ADD COLUMN status varchar(10) NOT NULL DEFAULT 'joined';
+
+UPDATE events_event_joined_by j
+SET joined_at = e.creation_ts
+FROM events_event e
+WHERE e.id = j.event_id;
+
+ALTER TABLE events_event_joined_by
+    ALTER COLUMN joined_at SET NOT NULL,
+    ALTER COLUMN status DROP DEFAULT;
+"""
+
+DROP_COLUMNS = """
+ALTER TABLE events_event_joined_by
+    DROP COLUMN joined_at,
+    DROP COLUMN status;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_rating_event_related_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Participation',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('joined_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('status', models.CharField(choices=[('joined', 'Iscritto'), ('checked_in', 'Presente')], default='joined', max_length=10)),
+                        ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participations', to='events.event')),
+                        ('user', models.ForeignKey(db_column='customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='participations', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'events_event_joined_by',
+                        'unique_together': {('event', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='event',
+                    name='joined_by',
+                    field=models.ManyToManyField(related_name='joined_events', through='events.Participation', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(ADD_COLUMNS, DROP_COLUMNS),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['event', 'joined_at', 'id'], name='participation_event_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['user', 'event'], name='participation_user_event_idx'),
+        ),
+    ]
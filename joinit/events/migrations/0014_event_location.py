@@ -0,0 +1,66 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_location(apps, schema_editor):
+    from events.geo import locate
+
+    Event = apps.get_model('events', 'Event')
+    places = Event.objects.exclude(place='').values_list('place', flat=True).distinct()
+    for place in places.iterator():
+        location = locate(place)
+        Event.objects.filter(place=place).update(
+            city=location.city, region=location.region, country=location.country,
+            latitude=location.latitude, longitude=location.longitude,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_participation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='city',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='country',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='region',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['country', 'region', 'city'], name='event_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['city'], name='event_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('latitude__isnull', False)), fields=['latitude', 'longitude'], name='event_lat_lon_idx'),
+        ),
+        migrations.RunPython(populate_location, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0015_feed_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('event', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='events.event')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='events.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'rank'], name='event_neighbour_rank_idx')],
+                'unique_together': {('event', 'neighbour')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0016_event_neighbours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Ricalcolo della feed di un utente'), ('event', 'Nuovo evento da aggiungere alle feed')], max_length=5)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
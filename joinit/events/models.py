@@ -1,15 +1,152 @@
-import hashlib
-from pathlib import Path
-from django.db import models
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Upper
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from blobs.models import MediaBlob
+from .caching import invalidate_events_cache
+from .geo import locate
 from users.models import CustomUser
-    
+
+
+LOCATION_FIELDS = ('city', 'region', 'country', 'latitude', 'longitude')
+
+
+def normalize_tags(tags):
+    """Tag senza spazi ai bordi, in minuscolo, senza vuoti né duplicati (l'ordine è mantenuto)."""
+    normalized = []
+    for tag in tags or []:
+        tag = tag.strip().casefold()
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+# Un bucket per ogni mezza stella da 0.0 a 5.0
+RATING_BUCKETS = 11
+
+
+def rating_bucket(value):
+    return int(Decimal(value) * 2)
+
+
+def empty_rating_histogram():
+    return [0] * RATING_BUCKETS
+
+
+class TagCountManager(models.Manager):
+
+    def apply(self, added=(), removed=()):
+        """Aggiorna i contatori dei tag aggiunti e rimossi da un evento."""
+        if added:
+            self.bulk_create([TagCount(tag=tag) for tag in added], ignore_conflicts=True)
+            self.filter(tag__in=added).update(event_count=F('event_count') + 1)
+        if removed:
+            self.filter(tag__in=removed, event_count__gt=0).update(event_count=F('event_count') - 1)
+
+
+class TagCount(models.Model):
+    """Numero di eventi pubblici e non annullati per tag, usato dall'autocompletamento."""
+    tag = models.CharField(max_length=30, primary_key=True)
+    event_count = models.PositiveIntegerField(default=0)
+
+    objects = TagCountManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-event_count', 'tag'], name='tagcount_popular_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag} ({self.event_count})'
+
+
+class EventQuerySet(models.QuerySet):
+
+    def joined_by_user(self, user_id):
+        """EXISTS sulla tabella dei partecipanti: niente join né DISTINCT sugli eventi."""
+        return Exists(
+            Participation.objects.filter(event_id=OuterRef('pk'), user_id=user_id)
+        )
+
+    def listed_for(self, user_id=None):
+        """Eventi della home: pubblici e non annullati, più quelli privati a cui l'utente partecipa."""
+        visibility = Q(is_private=False, cancelled=False)
+        if user_id:
+            visibility |= Q(is_private=True) & self.joined_by_user(user_id)
+        return self.filter(visibility)
+
+    @staticmethod
+    def listing_prefetches():
+        """Relazioni lette da EventSerializer: due query in tutto, qualunque sia la pagina."""
+        return [
+            Prefetch('joined_by', queryset=CustomUser.objects.only('id')),
+            Prefetch('ratings', queryset=Rating.objects.select_related('user')),
+        ]
+
+    def for_listing(self):
+        return self.prefetch_related(*self.listing_prefetches())
+
+    def with_free_spot(self):
+        """Eventi con posti liberi (max_participants nullo = nessun limite)."""
+        return self.filter(Q(max_participants__isnull=True) | Q(participants_count__lt=F('max_participants')))
+
+    def recount_participants(self):
+        """Ricalcola participants_count dalla tabella dei partecipanti."""
+        counts = (
+            Participation.objects.filter(event_id=OuterRef('pk'))
+            .values('event_id').annotate(total=Count('*')).values('total')
+        )
+        return self.update(participants_count=Coalesce(Subquery(counts), 0), last_modified_ts=timezone.now())
+
+    def apply_rating(self, event_id, added=None, removed=None):
+        """
+        Aggiorna conteggio, somma, media e istogramma dei voti di un evento
+        quando un voto viene aggiunto, tolto o cambiato (removed -> added).
+        La riga è bloccata fino al commit, così voti concorrenti non si perdono.
+        """
+        with transaction.atomic():
+            stats = self.select_for_update().filter(pk=event_id).values(
+                'rating_count', 'rating_sum', 'rating_histogram',
+            ).first()
+            if stats is None:
+                return 0
+
+            count, total = stats['rating_count'], stats['rating_sum']
+            histogram = list(stats['rating_histogram'])
+            for value, delta in ((removed, -1), (added, 1)):
+                if value is None:
+                    continue
+                count += delta
+                total += delta * Decimal(value)
+                histogram[rating_bucket(value)] += delta
+
+            average = (total / count).quantize(Decimal('0.01'), ROUND_HALF_UP) if count else Decimal(0)
+            return self.filter(pk=event_id).update(
+                rating_count=count, rating_sum=total, rating_avg=average, rating_histogram=histogram,
+                last_modified_ts=timezone.now(),
+            )
+
+    def searchable_by(self, user_id=None):
+        """Eventi pubblici, più quelli privati che l'utente ha creato o a cui partecipa."""
+        visibility = Q(is_private=False)
+        if user_id:
+            visibility |= Q(is_private=True) & (Q(created_by_id=user_id) | self.joined_by_user(user_id))
+        return self.filter(visibility)
+
+
 class Rating(models.Model):
-    event = models.ForeignKey('Event', on_delete=models.CASCADE)
+    event = models.ForeignKey('Event', on_delete=models.CASCADE, related_name='ratings')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     rating = models.DecimalField(max_digits=2, decimal_places=1, choices=[(x/2, str(x/2)) for x in range(2, 11)])
     review = models.TextField(blank=True, null=True)
@@ -41,6 +178,12 @@ class Event(models.Model):
     category    = models.PositiveIntegerField(choices=EventType, default=EventType.OTHER, blank=True, null=True)
     tags        = ArrayField(models.CharField(max_length=30), blank=True, default=list) 
     place       = models.CharField(max_length=200, default="")
+    # Ricavati da place a ogni salvataggio (events.geo.locate), senza geocoding esterno
+    city        = models.CharField(max_length=100, blank=True, default="", editable=False)
+    region      = models.CharField(max_length=100, blank=True, default="", editable=False)
+    country     = models.CharField(max_length=100, blank=True, default="", editable=False)
+    latitude    = models.FloatField(null=True, blank=True, editable=False)
+    longitude   = models.FloatField(null=True, blank=True, editable=False)
 
     event_date      = models.DateTimeField()
     creation_ts     = models.DateTimeField(auto_now_add=True, null=False)
@@ -49,6 +192,14 @@ class Event(models.Model):
 
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='events')
     max_participants = models.PositiveIntegerField(default=20, blank=True, null=True)
+    # Contatore di joined_by, aggiornato da join/cancel_join senza passare da save()
+    participants_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Aggregati dei voti, aggiornati da EventQuerySet.apply_rating
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.DecimalField(max_digits=9, decimal_places=1, default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_histogram = ArrayField(models.PositiveIntegerField(), size=RATING_BUCKETS, default=empty_rating_histogram, editable=False)
 
     cover_image = models.ImageField(upload_to='event_covers/',blank=True,null=True)
 
@@ -58,22 +209,53 @@ class Event(models.Model):
     is_private = models.BooleanField(default=False, null=False, blank=True)
     cancelled = models.BooleanField(default=False, null=False, blank=True)
 
-    joined_by = models.ManyToManyField(CustomUser, related_name='joined_events')
+    joined_by = models.ManyToManyField(CustomUser, through='Participation', related_name='joined_events')
+
+    objects = EventQuerySet.as_manager()
+
+    # Mantenuto dal trigger events_event_search_vector_trigger (migrazione 0006)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='event_search_vector_idx'),
+            GinIndex(fields=['tags'], name='event_tags_gin_idx'),
+            # Chiavi della paginazione a cursore
+            models.Index(fields=['-event_date', '-id'], name='event_date_id_idx'),
+            models.Index(fields=['created_by', '-event_date', '-id'], name='event_creator_date_id_idx'),
+            models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='event_rating_idx'),
+            # icontains e ricerca fuzzy lavorano su UPPER(colonna)
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='event_name_trgm_idx'),
+            GinIndex(OpClass(Upper('place'), name='gin_trgm_ops'), name='event_place_trgm_idx'),
+            models.Index(fields=['country', 'region', 'city'], name='event_location_idx'),
+            models.Index(fields=['city'], name='event_city_idx'),
+            # Ricerca per raggio: range sulla latitudine, longitudine filtrata nell'indice
+            models.Index(fields=['latitude', 'longitude'], name='event_lat_lon_idx', condition=Q(latitude__isnull=False)),
+        ]
+
+    def set_location(self):
+        location = locate(self.place)
+        for field in LOCATION_FIELDS:
+            setattr(self, field, getattr(location, field))
 
-    def _calculate_file_hash(self, file):
-        """Calcola l'hash MD5 di un file."""
-        hasher = hashlib.md5()
-        for chunk in file.chunks():
-            hasher.update(chunk)
-        return hasher.hexdigest()
+    def is_listed(self):
+        return not (self.is_private or self.cancelled)
+
+    def counted_tags(self):
+        """Tag che l'evento contribuisce a TagCount: solo eventi pubblici e non annullati."""
+        return set(self.tags) if self.is_listed() else set()
 
     def save(self, *args, validate_dates=True, **kwargs):
+        previous = Event.objects.filter(pk=self.pk).first() if self.pk else None
+        self.tags = normalize_tags(self.tags)
+        update_fields = kwargs.get('update_fields')
+        if previous is None or previous.place != self.place:
+            self.set_location()
+            if update_fields is not None and 'place' in update_fields:
+                kwargs['update_fields'] = update_fields = {*update_fields, *LOCATION_FIELDS}
+
         if validate_dates and not self.cancelled:
             min_date = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            if self.pk:
-                previous = Event.objects.filter(pk=self.pk).first()
-            else:
-                previous = None
 
             if self.participation_deadline:
                 if previous and self.participation_deadline == previous.participation_deadline:
@@ -84,30 +266,55 @@ class Event(models.Model):
                     )
                 if self.event_date and self.participation_deadline > self.event_date:
                     raise ValueError("Participation deadline must be before event date")
-        if self.pk:
-            previous = Event.objects.filter(pk=self.pk).first()
-            if self.cover_image and (not previous or self.cover_image != previous.cover_image):
-                current_hash = self._calculate_file_hash(self.cover_image)
-
-                existing_events = Event.objects.filter(cover_image__isnull=False)
-                for event in existing_events:
-                    if event.pk != self.pk and event.cover_image:
-                        file_path = Path(event.cover_image.path)
-                        if file_path.exists():
-                            with open(file_path, 'rb') as f:
-                                existing_hash = hashlib.md5(f.read()).hexdigest()
-                                if current_hash == existing_hash:
-                                    self.cover_image = event.cover_image
-                                    break
-            if previous and previous.cover_image and self.cover_image != previous.cover_image:
-                if previous.cover_image and Path(previous.cover_image.path).exists():
-                    previous.cover_image.delete(save=False)
-
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            if update_fields is None or 'cover_image' in update_fields:
+                # Le copertine sono nel blob store condiviso: un file per contenuto
+                old_cover = previous.cover_image.name if previous else None
+                self.cover_image = MediaBlob.objects.replace(old_cover, self.cover_image)
+            super().save(*args, **kwargs)
+
+            old_tags = previous.counted_tags() if previous else set()
+            new_tags = self.counted_tags()
+            TagCount.objects.apply(added=new_tags - old_tags, removed=old_tags - new_tags)
+
+            # Le feed contengono solo eventi pubblici e non annullati (events.feeds)
+            if previous is not None and previous.is_listed() and not self.is_listed():
+                FeedItem.objects.filter(event=self).delete()
+            elif previous is not None and previous.event_date != self.event_date:
+                FeedItem.objects.filter(event=self).update(event_date=self.event_date)
 
 
     def __str__(self):
         return self.name + ' - ' + self.place + ' - ' + str(self.event_date)
+
+
+class Participation(models.Model):
+    """Partecipazione di un utente a un evento: è la tabella di Event.joined_by."""
+
+    class Status(models.TextChoices):
+        JOINED = 'joined', _('Iscritto')
+        CHECKED_IN = 'checked_in', _('Presente')
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='participations')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_column='customuser_id', related_name='participations')
+    joined_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.JOINED)
+
+    class Meta:
+        # Tabella creata in origine per la M2M implicita (migrazione 0013)
+        db_table = 'events_event_joined_by'
+        unique_together = ('event', 'user')
+        indexes = [
+            # Elenco dei partecipanti in ordine di iscrizione, paginato a cursore
+            models.Index(fields=['event', 'joined_at', 'id'], name='participation_event_joined_idx'),
+            # Eventi di un utente e controllo "partecipa?" (EXISTS di visibilità)
+            models.Index(fields=['user', 'event'], name='participation_user_event_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} joined {self.event}'
+
     
     #User stories  17 
 class Favorite(models.Model):
@@ -120,3 +327,121 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} favorited {self.event}'
+
+
+class FeedItem(models.Model):
+    """
+    Evento della home personalizzata di un utente, con il punteggio calcolato
+    da events.feeds: la feed si legge in ordine dall'indice (user, -score).
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='feed_items')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='feed_items')
+    score = models.FloatField()
+    # Copia di Event.event_date: gli eventi passati si scartano senza join
+    event_date = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'event')
+        indexes = [
+            models.Index(fields=['user', '-score', 'event_date', 'id'], name='feed_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event} in feed of {self.user} ({self.score:.2f})'
+
+
+class FeedUpdateQuerySet(models.QuerySet):
+
+    def claim(self, batch_size):
+        """
+        Blocca un lotto di aggiornamenti, i più vecchi prima, saltando quelli già
+        presi da altri worker (SELECT ... FOR UPDATE SKIP LOCKED). Va chiamato in una transazione.
+        """
+        return list(self.order_by('id').select_for_update(skip_locked=True)[:batch_size])
+
+
+class FeedUpdateManager(models.Manager.from_queryset(FeedUpdateQuerySet)):
+
+    def queue_users(self, user_ids):
+        """Accoda il ricalcolo delle feed: viene scritto nella transazione corrente ed eseguito dal worker."""
+        return self.bulk_create([FeedUpdate(kind=FeedUpdate.Kind.USER, target_id=user_id) for user_id in user_ids])
+
+    def queue_event(self, event_id):
+        return self.create(kind=FeedUpdate.Kind.EVENT, target_id=event_id)
+
+
+class FeedUpdate(models.Model):
+    """
+    Aggiornamento delle feed in attesa, eseguito dal comando process_feed_updates
+    fuori dalle richieste (events.feeds.process_feed_updates).
+    """
+
+    class Kind(models.TextChoices):
+        USER = 'user', 'Ricalcolo della feed di un utente'
+        EVENT = 'event', 'Nuovo evento da aggiungere alle feed'
+
+    kind = models.CharField(max_length=5, choices=Kind.choices)
+    # Utente o evento, secondo ``kind``
+    target_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = FeedUpdateManager()
+
+    def __str__(self):
+        return f'{self.kind} {self.target_id}'
+
+
+class EventNeighbour(models.Model):
+    """
+    Evento simile a ``event`` per partecipazioni e preferiti in comune, con
+    punteggio e posizione. Scritta solo da build_recommendations (events.recommendations).
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='neighbours', db_index=False)
+    neighbour = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('event', 'neighbour')
+        indexes = [
+            # /events/{id}/recommended/: i vicini di un evento in ordine
+            models.Index(fields=['event', 'rank'], name='event_neighbour_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.neighbour} similar to {self.event} ({self.score:.2f})'
+
+
+@receiver(post_delete, sender=Event)
+def release_cover_image(sender, instance, **kwargs):
+    MediaBlob.objects.release(instance.cover_image.name)
+
+
+@receiver(post_delete, sender=Event)
+def remove_tag_counts(sender, instance, **kwargs):
+    TagCount.objects.apply(removed=instance.counted_tags())
+
+
+@receiver(m2m_changed, sender=Participation)
+def sync_participants_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mantiene participants_count quando joined_by cambia tramite il related manager (admin, shell)."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_event_ids = list(instance.joined_events.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        event_ids = [instance.pk]
+    elif action == 'post_clear':
+        event_ids = instance.__dict__.pop('_cleared_event_ids', [])
+    else:
+        event_ids = pk_set
+    Event.objects.filter(pk__in=event_ids).recount_participants()
+    invalidate_events_cache()
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Rating)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_events_cache()
@@ -0,0 +1,187 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Come DjangoJSONEncoder, ma senza troncare i microsecondi delle date."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginazione a cursore (keyset) sull'ordinamento del queryset, che deve
+    terminare con una chiave univoca, es. ``order_by('-event_date', '-id')``.
+
+    Ogni pagina è un range scan sull'indice a partire dall'ultima riga della
+    pagina precedente, quindi costa uguale a qualsiasi profondità.
+    ``?count=false`` evita il COUNT(*) del totale. Per compatibilità con il
+    frontend ``?page=N`` (N > 1) usa ancora la paginazione a offset.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    legacy_pagination_class = PageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_legacy(request):
+            return self.legacy.paginate_queryset(queryset, request, view)
+        window = self.window(queryset, request)
+        self.count = queryset.count() if self.include_count(request) else None
+        return self.page(list(window[:self.page_size + 1]))
+
+    def use_legacy(self, request):
+        self.request = request
+        self.legacy = None
+        page_number = request.query_params.get(self.legacy_pagination_class.page_query_param)
+        if self.cursor_query_param not in request.query_params and page_number not in (None, '', '1'):
+            self.legacy = self.legacy_pagination_class()
+        return self.legacy is not None
+
+    def window(self, queryset, request):
+        """Queryset ordinato nel verso richiesto e filtrato dopo la posizione del cursore."""
+        self.ordering = self.get_ordering(queryset)
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            queryset = queryset.order_by(*[self.invert(field) for field in self.ordering])
+        ordering = queryset.query.order_by
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(ordering, self.position))
+            except (TypeError, ValueError, ValidationError):
+                # Cursore ben formato ma con valori del tipo sbagliato per i campi
+                raise NotFound('Invalid cursor')
+        return queryset
+
+    def page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.first = results[0] if results else None
+        self.last = results[-1] if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+
+        response = {}
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to false to skip the total count.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() not in ('0', 'false', 'no')
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if not ordering or not all(isinstance(field, str) for field in ordering):
+            raise ImproperlyConfigured('KeysetPagination requires a queryset ordered by field names.')
+        return list(ordering)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        """
+        Righe che vengono dopo ``position`` nell'ordinamento dato:
+        (a, b, c) > (x, y, z) diventa a > x OR (a = x AND b > y) OR ...
+        La prima condizione (a >= x) permette il range scan sull'indice.
+        """
+        first = ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            after = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{after}': value})
+            equal &= Q(**{name: value})
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & condition
+
+    def position_of(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, instance, reverse):
+        payload = json.dumps({'p': self.position_of(instance), 'r': reverse}, cls=CursorEncoder)
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.legacy_pagination_class.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError, BinasciiError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
@@ -0,0 +1,164 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from users.models import CustomUser
+from .caching import invalidate_events_cache
+from .models import Event, FeedUpdate, Participation
+
+# Utenti accettati in una sola richiesta di aggiunta o rimozione
+BULK_LIMIT = 1000
+
+
+def join_event(event, user_id):
+    """
+    Iscrive l'utente all'evento. Restituisce ``joined``, ``already_joined`` o ``event_full``.
+
+    Prima la riga di partecipazione (il vincolo unique scarta i doppi join),
+    poi l'UPDATE condizionale sul contatore: il lock sulla riga dell'evento
+    dura solo fino al commit e due join concorrenti non superano il limite.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Participation.objects.create(event_id=event.pk, user_id=user_id)
+        except IntegrityError:
+            return 'already_joined'
+
+        joined = Event.objects.filter(pk=event.pk).with_free_spot().update(
+            participants_count=F('participants_count') + 1, last_modified_ts=timezone.now(),
+        )
+        if not joined:
+            transaction.set_rollback(True)
+            return 'event_full'
+        invalidate_events_cache()
+        # I tag degli eventi a cui partecipa cambiano i gusti dell'utente: la feed
+        # si ricalcola fuori dalla richiesta (process_feed_updates)
+        FeedUpdate.objects.queue_users([user_id])
+    return 'joined'
+
+
+def leave_event(event, user_id):
+    """Toglie l'utente dall'evento. Restituisce ``left``, ``not_joined`` o ``organizer``."""
+    membership = Participation.objects.filter(event_id=event.pk, user_id=user_id)
+    if event.created_by_id == user_id:
+        return 'organizer' if membership.exists() else 'not_joined'
+
+    with transaction.atomic():
+        deleted, _ = membership.delete()
+        if not deleted:
+            return 'not_joined'
+        Event.objects.filter(pk=event.pk).update(
+            participants_count=F('participants_count') - 1, last_modified_ts=timezone.now(),
+        )
+        invalidate_events_cache()
+    return 'left'
+
+
+def parse_identifiers(values):
+    """Id (numeri) ed email, nell'ordine ricevuto e senza duplicati."""
+    identifiers = []
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+            value = int(value)
+        elif isinstance(value, str):
+            value = value.strip()
+        else:
+            continue
+        if value not in identifiers:
+            identifiers.append(value)
+    return identifiers
+
+
+def _resolve(identifiers):
+    """Utenti corrispondenti agli identificativi, con una sola query."""
+    ids = [value for value in identifiers if isinstance(value, int)]
+    emails = [value for value in identifiers if isinstance(value, str)]
+    users = CustomUser.objects.filter(Q(id__in=ids) | Q(email__in=emails)).values('id', 'email', 'can_join')
+    by_key = {}
+    for user in users:
+        by_key[user['id']] = by_key[user['email']] = user
+    return by_key
+
+
+def _result(identifier, user, status):
+    return {'user': identifier, 'id': user['id'] if user else None, 'status': status}
+
+
+def add_participants(event_id, values):
+    """
+    Aggiunge in blocco i partecipanti a un evento: un INSERT per tutti, con
+    il controllo dei posti fatto una volta sola sulla riga dell'evento bloccata.
+    Chi non trova posto viene segnalato come ``event_full``.
+    """
+    identifiers = parse_identifiers(values)
+    users = _resolve(identifiers)
+
+    with transaction.atomic():
+        event = Event.objects.select_for_update().values('participants_count', 'max_participants').get(pk=event_id)
+        free = None if event['max_participants'] is None else max(event['max_participants'] - event['participants_count'], 0)
+        joined = set(Participation.objects.filter(
+            event_id=event_id, user_id__in=[user['id'] for user in users.values()],
+        ).values_list('user_id', flat=True))
+
+        results, added = [], []
+        for identifier in identifiers:
+            user = users.get(identifier)
+            if user is None:
+                status = 'not_found'
+            elif user['id'] in joined:
+                status = 'already_joined'
+            elif not user['can_join']:
+                status = 'not_allowed'
+            elif free is not None and len(added) >= free:
+                status = 'event_full'
+            else:
+                status = 'added'
+                added.append(user['id'])
+                joined.add(user['id'])
+            results.append(_result(identifier, user, status))
+
+        if added:
+            Participation.objects.bulk_create(
+                [Participation(event_id=event_id, user_id=user_id) for user_id in added], ignore_conflicts=True,
+            )
+            # Ricontato invece di sommare: un join concorrente può aver inserito la stessa riga
+            Event.objects.filter(pk=event_id).recount_participants()
+            invalidate_events_cache()
+            FeedUpdate.objects.queue_users(added)
+    return results
+
+
+def remove_participants(event_id, values):
+    """Toglie in blocco i partecipanti da un evento (l'organizzatore non può essere tolto)."""
+    identifiers = parse_identifiers(values)
+    users = _resolve(identifiers)
+
+    with transaction.atomic():
+        event = Event.objects.select_for_update().values('created_by_id').get(pk=event_id)
+        joined = set(Participation.objects.filter(
+            event_id=event_id, user_id__in=[user['id'] for user in users.values()],
+        ).values_list('user_id', flat=True))
+
+        results, removed = [], []
+        for identifier in identifiers:
+            user = users.get(identifier)
+            if user is None:
+                status = 'not_found'
+            elif user['id'] == event['created_by_id']:
+                status = 'organizer'
+            elif user['id'] not in joined:
+                status = 'not_joined'
+            else:
+                status = 'removed'
+                removed.append(user['id'])
+                joined.discard(user['id'])
+            results.append(_result(identifier, user, status))
+
+        if removed:
+            Participation.objects.filter(event_id=event_id, user_id__in=removed).delete()
+            Event.objects.filter(pk=event_id).recount_participants()
+            invalidate_events_cache()
+    return results
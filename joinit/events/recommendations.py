@@ -0,0 +1,118 @@
+"""
+Raccomandazioni item-item dal grafo utenti × eventi (partecipazioni e
+preferiti), calcolate offline con NumPy/SciPy da build_recommendations.
+Le richieste leggono solo la tabella EventNeighbour.
+"""
+import io
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .caching import invalidate_events_cache
+from .models import Event, EventNeighbour, Favorite, Participation
+
+RECOMMENDATION_TOP_K = 20
+JOIN_WEIGHT = 1.0
+FAVORITE_WEIGHT = 1.0
+# Eventi di cui si calcolano insieme le similarità: la matrice evento × evento non è mai intera in memoria
+SIMILARITY_BLOCK_SIZE = 1000
+
+
+def load_interactions():
+    """Utenti, eventi e pesi di partecipazioni e preferiti, come array NumPy paralleli."""
+    users, events, weights = [], [], []
+    for model, weight in ((Participation, JOIN_WEIGHT), (Favorite, FAVORITE_WEIGHT)):
+        pairs = model.objects.values_list('user_id', 'event_id').iterator(chunk_size=10_000)
+        pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        users.append(pairs[:, 0])
+        events.append(pairs[:, 1])
+        weights.append(np.full(len(pairs), weight))
+    return np.concatenate(users), np.concatenate(events), np.concatenate(weights)
+
+
+def interaction_matrix(users, events, weights):
+    """
+    Matrice sparsa utenti × eventi (CSC) e id degli eventi delle colonne,
+    in ordine crescente. Partecipazione e preferito dello stesso utente si sommano.
+    """
+    user_ids, rows = np.unique(users, return_inverse=True)
+    event_ids, columns = np.unique(events, return_inverse=True)
+    matrix = sparse.csc_matrix((weights, (rows, columns)), shape=(len(user_ids), len(event_ids)))
+    matrix.sum_duplicates()
+    return matrix, event_ids
+
+
+def top_neighbours(matrix, candidates, top_k=RECOMMENDATION_TOP_K, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Per ogni colonna della matrice, le ``top_k`` colonne più simili tra
+    quelle ``candidates`` (maschera booleana), per similarità del coseno:
+    conta chi ha partecipato o messo tra i preferiti entrambi gli eventi.
+    Restituisce gli array (colonna, vicina, punteggio, rango).
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1
+    normalized = (matrix @ sparse.diags(1 / norms)).tocsc()
+    candidate_columns = np.flatnonzero(candidates)
+    targets = normalized[:, candidate_columns]
+
+    sources, neighbours, scores, ranks = [], [], [], []
+    for start in range(0, matrix.shape[1], block_size):
+        similarity = (normalized[:, start:start + block_size].T @ targets).tocsr()
+        for row in range(similarity.shape[0]):
+            begin, end = similarity.indptr[row], similarity.indptr[row + 1]
+            columns = candidate_columns[similarity.indices[begin:end]]
+            values = similarity.data[begin:end]
+            keep = (columns != start + row) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k)[:top_k]
+                columns, values = columns[best], values[best]
+            # Punteggio decrescente, a parità l'evento meno recente
+            order = np.lexsort((columns, -values))
+            sources.append(np.full(len(order), start + row))
+            neighbours.append(columns[order])
+            scores.append(values[order])
+            ranks.append(np.arange(1, len(order) + 1))
+
+    if not sources:
+        return tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.int64))
+    return tuple(np.concatenate(arrays) for arrays in (sources, neighbours, scores, ranks))
+
+
+def store_neighbours(events, neighbours, scores, ranks):
+    """
+    Sostituisce il contenuto di EventNeighbour con un COPY, in una sola
+    transazione: fino al commit le richieste leggono i vicini precedenti.
+    """
+    buffer = io.StringIO()
+    for row in zip(events.tolist(), neighbours.tolist(), scores.tolist(), ranks.tolist()):
+        buffer.write('%d\t%d\t%.6f\t%d\n' % row)
+    buffer.seek(0)
+
+    table = connection.ops.quote_name(EventNeighbour._meta.db_table)
+    with transaction.atomic():
+        # DELETE e non TRUNCATE: TRUNCATE bloccherebbe anche le letture fino al commit
+        EventNeighbour.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {table} (event_id, neighbour_id, score, rank) FROM STDIN', buffer)
+    invalidate_events_cache()
+
+
+def build_recommendations(top_k=RECOMMENDATION_TOP_K, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Ricalcola i vicini di tutti gli eventi con interazioni. Solo gli eventi
+    pubblici, non annullati e futuri possono essere raccomandati.
+    Restituisce il numero di interazioni, di eventi e di vicini salvati.
+    """
+    users, events, weights = load_interactions()
+    matrix, event_ids = interaction_matrix(users, events, weights)
+    recommendable = Event.objects.filter(
+        is_private=False, cancelled=False, event_date__gte=timezone.now(),
+    ).values_list('id', flat=True)
+    candidates = np.isin(event_ids, np.fromiter(recommendable.iterator(), dtype=np.int64))
+
+    sources, neighbours, scores, ranks = top_neighbours(matrix, candidates, top_k, block_size)
+    store_neighbours(event_ids[sources], event_ids[neighbours], scores, ranks)
+    return {'interactions': len(users), 'events': len(event_ids), 'neighbours': len(sources)}
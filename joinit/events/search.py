@@ -0,0 +1,163 @@
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Upper
+from rest_framework.exceptions import ValidationError
+
+from .geo import bounding_box, distance_km
+from .models import Event, normalize_tags
+
+SEARCH_CONFIG = 'italian'
+NEAR_DEFAULT_RADIUS_KM = 10
+NEAR_MAX_RADIUS_KM = 500
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def build_search_query(text):
+    """
+    Converte il parametro ``q`` in una tsquery sul vettore di ricerca degli eventi.
+
+    I pezzi separati da virgola sono in OR (come i tag), le parole di uno stesso
+    pezzo in AND; ogni parola è un prefisso, così "conc" trova "concerto".
+    Restituisce ``None`` se il testo non contiene parole.
+    """
+    groups = []
+    for piece in text.split(','):
+        words = _WORD_RE.findall(piece.lower())
+        if words:
+            groups.append('(' + ' & '.join(f'{word}:*' for word in words) + ')')
+    if not groups:
+        return None
+    return SearchQuery(' | '.join(groups), config=SEARCH_CONFIG, search_type='raw')
+
+
+def contains_filter(field, value, fuzzy=False):
+    """
+    Filtro "contiene" su un campo testuale, servito dall'indice trigram su
+    UPPER(campo). In modalità fuzzy accetta errori di battitura
+    ("Napli" trova "Napoli") usando la word similarity di pg_trgm.
+    """
+    if fuzzy:
+        return TrigramWordSimilar(Upper(field), value.upper())
+    return Q(**{f'{field}__icontains': value})
+
+
+@contextmanager
+def fuzzy_threshold(enabled=True):
+    """
+    Transazione in cui l'operatore %> di pg_trgm usa SEARCH_FUZZY_THRESHOLD.
+    La soglia è locale alla transazione (``set_config(..., true)``): non resta
+    sulla connessione quando torna al pool. Le query fuzzy vanno valutate dentro.
+    """
+    if not enabled:
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(settings.SEARCH_FUZZY_THRESHOLD)],
+            )
+        yield
+
+
+def parse_near(params):
+    """
+    ``near=lat,lon`` e ``radius_km`` (predefinito 10, massimo 500) come
+    (lat, lon, raggio), oppure ``None`` se ``near`` manca.
+    """
+    near = params.get('near', '').strip()
+    if not near:
+        return None
+    try:
+        latitude, longitude = (float(value) for value in near.split(','))
+    except ValueError:
+        raise ValidationError({'near': 'Expected "latitude,longitude".'})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError({'near': 'Coordinates out of range.'})
+    try:
+        radius = float(params.get('radius_km') or NEAR_DEFAULT_RADIUS_KM)
+    except ValueError:
+        raise ValidationError({'radius_km': 'Must be a number.'})
+    if not 0 < radius <= NEAR_MAX_RADIUS_KM:
+        raise ValidationError({'radius_km': f'Must be between 0 and {NEAR_MAX_RADIUS_KM}.'})
+    return latitude, longitude, radius
+
+
+def near_filter(latitude, longitude, radius_km):
+    """
+    Filtro sul quadrato che contiene il cerchio: è un range scan su
+    event_lat_lon_idx, la distanza esatta si calcola solo sulle righe trovate.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    return Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+
+
+def is_fuzzy(request):
+    return _is_fuzzy(request.query_params)
+
+
+def _is_fuzzy(params):
+    return params.get('fuzzy', '').lower() in ('1', 'true', 'yes')
+
+
+def search_queryset(params):
+    """
+    Eventi trovati con i parametri di ricerca ``params`` (``q``, ``place``, ``name``,
+    ``category``, ``max_price``, ``tags``, ``near``, ...) e visibili a ``userId``, già
+    ordinati. Con ``fuzzy`` va valutato dentro fuzzy_threshold().
+    """
+    filters = Q(cancelled=False)
+
+    search_query = None
+    if 'q' in params and params['q'].strip():
+        q = params['q'].strip()
+        category_mapping = {label.lower(): value for value, label in Event.EventType.choices}
+        category_value = category_mapping.get(q.lower())
+        search_query = build_search_query(q)
+
+        text_filter = Q(search_vector=search_query) if search_query is not None else Q(pk__in=[])
+        if category_value is not None:
+            text_filter |= Q(category=category_value)
+        filters &= text_filter
+
+    fuzzy = _is_fuzzy(params)
+    if 'place' in params and params['place'].strip():
+        filters &= contains_filter('place', params['place'].strip(), fuzzy)
+    if 'name' in params and params['name'].strip():
+        filters &= contains_filter('name', params['name'].strip(), fuzzy)
+    if 'category' in params and params['category'].isdigit():
+        filters &= Q(category=int(params['category']))
+    if 'max_price' in params and params['max_price'].replace('.', '', 1).isdigit():
+        filters &= Q(price__lte=float(params['max_price']))
+    if 'max_participants' in params and params['max_participants'].isdigit():
+        filters &= Q(max_participants__lte=int(params['max_participants']))
+    if 'tags' in params and params['tags'].strip():
+        filters &= Q(tags__overlap=normalize_tags(params['tags'].split(',')))
+
+    near = parse_near(params)
+    if near is not None:
+        filters &= near_filter(*near)
+
+    user_id = params.get('userId')
+    events = Event.objects.searchable_by(user_id).filter(filters).for_listing()
+    if near is not None:
+        events = events.annotate(distance=distance_km(*near[:2])).filter(distance__lte=near[2])
+
+    if near is not None and params.get('ordering') == 'distance':
+        events = events.order_by('distance', 'id')
+    elif params.get('ordering') == 'rating':
+        events = events.order_by('-rating_avg', '-rating_count', '-id')
+    elif search_query is not None:
+        # double precision: il rank viene riusato nei cursori di paginazione
+        rank = Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        events = events.annotate(rank=rank).order_by('-rank', '-event_date', '-id')
+    else:
+        events = events.order_by('-event_date', '-id')
+    return events
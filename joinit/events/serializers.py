@@ -1,6 +1,6 @@
 from django.conf import settings
 from rest_framework import serializers
-from .models import Event, Rating, Favorite
+from .models import Event, Participation, Rating, Favorite, TagCount, normalize_tags
 from users.serializers import UserSerializer 
 from rest_framework.reverse import reverse 
 from decimal import Decimal
@@ -8,7 +8,7 @@ from decimal import Decimal
 class RatingSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     userId = serializers.ReadOnlyField(source='user.id') 
-    event_id = serializers.ReadOnlyField(source='event.id')
+    event_id = serializers.ReadOnlyField()
     rating = serializers.DecimalField(max_digits=2, decimal_places=1)  # Keep it as decimal,please
 
     class Meta:
@@ -43,9 +43,16 @@ class EventSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Event
-        fields = '__all__'
+        exclude = ['search_vector', 'rating_sum']
         read_only_fields = ['created_by', 'creation_ts', 'last_modified_ts', 'joined_by']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldset (?fields= / ?view=card): serializza solo i campi richiesti
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def validate_tags(self, value):
         if value in [None, ""]:
             return []
@@ -54,7 +61,7 @@ class EventSerializer(serializers.ModelSerializer):
         for tag in value:
             if not isinstance(tag, str) or not tag.strip():
                 raise serializers.ValidationError(f"Invalid tag: {tag}. Tags must be non-empty strings.")
-        return value
+        return normalize_tags(value)
 
     def validate_cover_image(self, value):
         if value and not value.name.lower().endswith(('.png', '.jpg', '.jpeg')):
@@ -69,6 +76,16 @@ class EventSerializer(serializers.ModelSerializer):
         print(f"Nessuna immagine trovata per l'evento '{obj.name}'")
         return None
 
+class ParticipationSerializer(serializers.ModelSerializer):
+    userId = serializers.ReadOnlyField(source='user_id')
+    first_name = serializers.ReadOnlyField(source='user.first_name')
+    last_name = serializers.ReadOnlyField(source='user.last_name')
+    profile_picture = serializers.ImageField(source='user.profile_picture', read_only=True)
+
+    class Meta:
+        model = Participation
+        fields = ['id', 'userId', 'first_name', 'last_name', 'profile_picture', 'joined_at', 'status']
+
 class FavoriteSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source="user.id")
     event = serializers.ReadOnlyField(source="event.id")
@@ -76,3 +93,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
         fields = ['id', 'user', 'event', 'created_at']
+
+class TagCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TagCount
+        fields = ['tag', 'event_count']
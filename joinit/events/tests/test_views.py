@@ -1,11 +1,36 @@
+import base64
+import csv
 import datetime
+import json
+import math
+import os
+import threading
 import time_machine
 
-from django.urls import reverse
+from asgiref.sync import sync_to_async
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from events.models import Event
+from events.async_views import with_cached_reads
+from events.caching import VERSION_KEY, events_version, response_cache_counts
+from events.fieldsets import CARD_FIELDS
+from events.maps import MAP_MAX_CELLS
+from events.models import Event, EventNeighbour, Favorite, FeedItem, FeedUpdate, Participation, Rating, empty_rating_histogram
+from events.search import near_filter
+from events.serializers import EventSerializer
+from events.urls import router
 from users.models import CustomUser
 
 class TestEventsViewSet(APITestCase):
@@ -31,6 +56,10 @@ class TestEventsViewSet(APITestCase):
             "is_private": False
     }
 
+    def setUp(self):
+        # La cache su file non segue il rollback dei test
+        cache.clear()
+
     @classmethod
     def setUpTestData(cls):
         cls.user = CustomUser.objects.create(email='joinit@user.it', password='mypassword')
@@ -101,4 +130,724 @@ class TestEventsViewSet(APITestCase):
             self.assertEqual(event_data['price'], str(self.sample_event['price']))  # Decimal fields are returned as strings
             self.assertEqual(event_data['category'], self.sample_event['category'])
             self.assertEqual(event_data['place'], self.sample_event['place'])
-            self.assertEqual(event_data['is_private'], self.sample_event['is_private'])
\ No newline at end of file
+            self.assertEqual(event_data['is_private'], self.sample_event['is_private'])
+
+    def _create_event(self, **fields):
+        date = timezone.now() + datetime.timedelta(days=7)
+        data = {**self.another_sample_event, 'event_date': date, 'participation_deadline': date, 'created_by': self.user}
+        data.update(fields)
+        return Event.objects.create(**data)
+
+    def test_search_events(self):
+        api_url = reverse('events-search-events')
+        in_name = self._create_event(name="Concerto jazz", description="Serata al porto")
+        in_description = self._create_event(name="Serata al porto", description="Un concerto all'aperto")
+        self._create_event(name="Mostra di pittura", description="Quadri moderni", tags=["arte"])
+
+        with self.subTest("stemming and ranking"):
+            response = self.client.get(api_url, {'q': 'concerti'})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual([e['id'] for e in response.data['results']], [in_name.id, in_description.id])
+
+        with self.subTest("prefix and tags"):
+            response = self.client.get(api_url, {'q': 'conc, arte'})
+            self.assertEqual(response.data['count'], 3)
+
+        with self.subTest("with filters"):
+            response = self.client.get(api_url, {'q': 'concerto', 'place': 'Roma', 'max_price': '10'})
+            self.assertEqual(response.data['count'], 2)
+
+        with self.subTest("fuzzy place"):
+            response = self.client.get(api_url, {'place': 'Romaa'})
+            self.assertEqual(response.data['count'], 0)
+            response = self.client.get(api_url, {'place': 'Romaa', 'fuzzy': 'true'})
+            self.assertEqual(response.data['count'], 3)
+
+    def test_search_near(self):
+        api_url = reverse('events-search-events')
+        napoli = self._create_event(place="Via del Mare, 1, 80100 Napoli (NA), Campania, Italia")
+        pozzuoli = self._create_event(place="Via Roma, 3, Pozzuoli, Campania, Italia")
+        roma = self._create_event(place="Piazza Navona, Roma")
+        altrove = self._create_event(place="Via Nuova, 2, Borgo Sconosciuto, Molise, Italia")
+
+        with self.subTest("location parsed at write time"):
+            self.assertEqual((napoli.city, napoli.region, napoli.country), ('Napoli', 'Campania', 'Italia'))
+            self.assertEqual((roma.city, roma.region, roma.country), ('Roma', 'Lazio', 'Italia'))
+            self.assertAlmostEqual(napoli.latitude, 40.85, places=1)
+            self.assertEqual((altrove.city, altrove.region, altrove.latitude), ('Borgo Sconosciuto', 'Molise', None))
+            roma.place = "Via del Porto, Pozzuoli"
+            roma.save(update_fields=['place'], validate_dates=False)
+            roma.refresh_from_db()
+            self.assertEqual((roma.city, roma.region), ('Pozzuoli', 'Campania'))
+            roma.place = "Piazza Navona, Roma"
+            roma.save(validate_dates=False)
+
+        with self.subTest("within radius"):
+            response = self.client.get(api_url, {'near': f'{napoli.latitude},{napoli.longitude}', 'radius_km': 20, 'ordering': 'distance'})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual([e['id'] for e in response.data['results']], [napoli.id, pozzuoli.id])
+            response = self.client.get(api_url, {'near': '41.9,12.5'})
+            self.assertEqual([e['id'] for e in response.data['results']], [roma.id])
+
+        with self.subTest("invalid"):
+            self.assertEqual(self.client.get(api_url, {'near': 'Napoli'}).status_code, 400)
+            self.assertEqual(self.client.get(api_url, {'near': '40.8,14.2', 'radius_km': '0'}).status_code, 400)
+
+        with self.subTest("bounding box index"):
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')  # tabella di test troppo piccola
+            plan = Event.objects.filter(near_filter(40.85, 14.27, 20)).explain()
+            self.assertIn('event_lat_lon_idx', plan)
+
+    def test_events_map(self):
+        api_url = reverse('events-map')
+        napoli = self._create_event(place="Via del Mare, 1, Napoli, Campania, Italia")
+        pozzuoli = self._create_event(place="Via Roma, 3, Pozzuoli, Campania, Italia")
+        roma = self._create_event(place="Piazza Navona, Roma")
+        private = self._create_event(place="Via Toledo, 5, Napoli", is_private=True)
+        self._create_event(place="Via Etnea, 1, Catania", cancelled=True)
+        italy = {'bbox': '6.6,35.5,18.6,47.1'}
+
+        with self.subTest("clusters at low zoom"):
+            response = self.client.get(api_url, {**italy, 'zoom': 5})
+            self.assertEqual(response.status_code, 200, response.data)
+            clusters = response.json()['clusters']
+            self.assertEqual(sorted(c['count'] for c in clusters), [1, 2])
+            self.assertEqual([c['event'] for c in clusters if c['count'] == 1], [roma.id])
+
+        with self.subTest("single markers at high zoom"):
+            response = self.client.get(api_url, {'bbox': '13.9,40.7,14.5,41.0', 'zoom': 12})
+            self.assertEqual(sorted(c['event'] for c in response.json()['clusters']), [napoli.id, pozzuoli.id])
+
+        with self.subTest("private events of participants"):
+            Participation.objects.create(event=private, user=self.user)
+            response = self.client.get(api_url, {**italy, 'zoom': 5, 'userId': self.user.id})
+            self.assertEqual(sum(c['count'] for c in response.json()['clusters']), 4)
+
+        with self.subTest("cells are capped"):
+            response = self.client.get(api_url, {'bbox': '-180,-90,180,90', 'zoom': 20})
+            size = response.json()['cell_size']
+            self.assertLessEqual(math.ceil(360 / size) * math.ceil(180 / size), MAP_MAX_CELLS)
+            self.assertEqual(sum(c['count'] for c in response.json()['clusters']), 3)
+
+        with self.subTest("invalid"):
+            self.assertEqual(self.client.get(api_url, {'bbox': '1,2,3', 'zoom': 5}).status_code, 400)
+            self.assertEqual(self.client.get(api_url, {**italy, 'zoom': 30}).status_code, 400)
+            self.assertEqual(self.client.get(api_url, {**italy, 'zoom': 5, 'userId': 'abc'}).status_code, 400)
+
+    def test_personalized_feed(self):
+        api_url = reverse('events-feed')
+        organizer = CustomUser.objects.create(email='organizer@user.it', password='mypassword')
+        other = CustomUser.objects.create(email='other@user.it', password='mypassword')
+        self.user.city = 'Naples'
+        self.user.save()
+        in_city = self._create_event(created_by=organizer, place="Via Toledo, 5, Napoli", category=1)
+        same_tags = self._create_event(created_by=organizer, place="Piazza Navona, Roma", category=4, tags=['jazz'])
+        favorite_category = self._create_event(created_by=organizer, place="Milano", category=3)
+        self._create_event(created_by=organizer, place="Torino", category=5)
+        self._create_event(created_by=organizer, place="Via Chiaia, Napoli", is_private=True)
+        joined = self._create_event(created_by=organizer, place="Bari", category=6, tags=['jazz', 'blues'])
+        Participation.objects.create(event=joined, user=self.user)
+        Favorite.objects.create(event=self._create_event(created_by=organizer, category=3, is_private=True), user=self.user)
+
+        with self.subTest("fallback before the first build"):
+            self.client.force_authenticate(other)
+            response = self.client.get(api_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 5)
+
+        call_command('build_feeds', stdout=StringIO())
+        self.client.force_authenticate(self.user)
+
+        with self.subTest("ranked by city, favorite categories and tags"):
+            with self.assertNumQueries(4):
+                response = self.client.get(api_url, {'view': 'card'})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual([e['id'] for e in response.data['results']], [in_city.id, favorite_category.id, same_tags.id])
+
+        with self.subTest("new events are added incrementally"):
+            by_tags = self._create_event(created_by=organizer, place="Pozzuoli", tags=['blues'])
+            # Solo la città: "Naples" dell'utente è Napoli come in Event.city
+            by_city = self._create_event(created_by=organizer, place="Via Roma, 3, Napoli", category=5)
+            for event in (by_tags, by_city):
+                FeedUpdate.objects.queue_event(event.pk)
+            call_command('process_feed_updates', '--once', stdout=StringIO())
+            ids = [e['id'] for e in self.client.get(api_url).data['results']]
+            self.assertIn(by_tags.id, ids)
+            self.assertIn(by_city.id, ids)
+            self.assertFalse(FeedUpdate.objects.exists())
+
+        with self.subTest("joining queues a refresh of the feed"):
+            response = self.client.put(reverse('events-join', args=[in_city.pk]), {'userId': self.user.id})
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertTrue(FeedUpdate.objects.filter(kind=FeedUpdate.Kind.USER, target_id=self.user.id).exists())
+            call_command('process_feed_updates', '--once', stdout=StringIO())
+            self.assertNotIn(in_city.id, [e['id'] for e in self.client.get(api_url).data['results']])
+
+        with self.subTest("cancelled events leave the feed"):
+            same_tags.cancelled = True
+            same_tags.save(validate_dates=False)
+            self.assertFalse(FeedItem.objects.filter(event=same_tags).exists())
+
+    def test_recommended_events(self):
+        users = [self.user] + [CustomUser.objects.create(email=f'fan{i}@user.it', password='mypassword') for i in range(3)]
+        source, often, sometimes, unrelated = (self._create_event(name=f'Evento {i}') for i in range(4))
+        private = self._create_event(is_private=True)
+        for user, events in zip(users, [(source, often, sometimes, private), (source, often, private), (source, sometimes, private), (source, unrelated)]):
+            for event in events:
+                Participation.objects.create(event=event, user=user)
+        Favorite.objects.create(event=often, user=users[3])
+
+        call_command('build_recommendations', stdout=StringIO())
+        api_url = reverse('events-recommended', args=[source.pk])
+
+        with self.subTest("ranked by co-participation"):
+            response = self.client.get(api_url)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual([e['id'] for e in response.data], [often.id, sometimes.id, unrelated.id])
+            neighbours = EventNeighbour.objects.filter(event=source).order_by('rank')
+            self.assertAlmostEqual(neighbours[0].score, 3 / (2 * 3 ** 0.5), places=5)
+
+        with self.subTest("only listed events at read time"):
+            sometimes.cancelled = True
+            sometimes.save(validate_dates=False)
+            self.assertEqual([e['id'] for e in self.client.get(api_url).data], [often.id, unrelated.id])
+
+        with self.subTest("unknown event"):
+            self.assertEqual(self.client.get(reverse('events-recommended', args=[0])).status_code, 404)
+
+    def test_tags_autocomplete(self):
+        api_url = reverse('events-tags')
+        event = self._create_event(tags=[" Musica ", "jazz", "MUSICA"])
+        self._create_event(tags=["musica", "mostra"])
+        self._create_event(tags=["musical"], is_private=True)
+
+        self.assertEqual(event.tags, ["musica", "jazz"])
+
+        response = self.client.get(api_url, {'prefix': 'Mu'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, [{'tag': 'musica', 'event_count': 2}])
+
+        event.cancelled = True
+        event.save(validate_dates=False)
+        response = self.client.get(api_url, {'prefix': 'm'})
+        self.assertEqual(response.data, [{'tag': 'mostra', 'event_count': 1}, {'tag': 'musica', 'event_count': 1}])
+
+    def test_list_public_cursor_pagination(self):
+        api_url = reverse('events-list-public')
+        date = timezone.now() + datetime.timedelta(days=7)
+        # Date ripetute: l'ordinamento deve spezzare i pareggi sull'id
+        events = [self._create_event(event_date=date + datetime.timedelta(days=i % 3), participation_deadline=date) for i in range(25)]
+        expected = [e.id for e in sorted(events, key=lambda e: (e.event_date, e.id), reverse=True)]
+
+        seen = []
+        response = self.client.get(api_url)
+        self.assertEqual(response.data['count'], 25)
+        while True:
+            seen += [e['id'] for e in response.data['results']]
+            if not response.data['next']:
+                break
+            previous_page = response
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+        with self.subTest("previous link"):
+            response = self.client.get(response.data['previous'])
+            self.assertEqual(response.data['results'], previous_page.data['results'])
+
+        with self.subTest("without count"):
+            response = self.client.get(api_url, {'count': 'false'})
+            self.assertNotIn('count', response.data)
+
+        with self.subTest("legacy page number"):
+            response = self.client.get(api_url, {'page': 2})
+            self.assertEqual([e['id'] for e in response.data['results']], expected[10:20])
+
+        with self.subTest("ranked search"):
+            response = self.client.get(reverse('events-search-events'), {'q': 'evento'})
+            seen = [e['id'] for e in response.data['results']]
+            seen += [e['id'] for e in self.client.get(response.data['next']).data['results']]
+            self.assertEqual(len(set(seen)), 20)
+            self.assertTrue(set(seen) <= set(expected))
+
+        with self.subTest("invalid cursor"):
+            for payload in ('{"p":["x","y"],"r":false}', '{"p":["2025-01-01T00:00:00+00:00","y"],"r":false}', '{"p":[null,1],"r":true}', 'nope'):
+                cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+                self.assertEqual(self.client.get(api_url, {'cursor': cursor}).status_code, 404, payload)
+            cursor = base64.urlsafe_b64encode(b'{"p":[{},1,2],"r":false}').decode()
+            self.assertEqual(self.client.get(reverse('events-search-events'), {'q': 'evento', 'cursor': cursor}).status_code, 404)
+
+    def test_join_updates_participants_count(self):
+        event = self._create_event(max_participants=2)
+        other = CustomUser.objects.create(email='other@user.it', password='mypassword')
+        third = CustomUser.objects.create(email='third@user.it', password='mypassword')
+        self.client.force_authenticate(self.user)
+        join_url = reverse('events-join', args=[event.pk])
+        cancel_url = reverse('events-cancel-join', args=[event.pk])
+
+        with self.subTest("join"):
+            self.assertEqual(self.client.put(join_url, {'userId': other.id}).status_code, 201)
+            self.assertEqual(self.client.put(join_url, {'userId': other.id}).status_code, 400)
+            event.refresh_from_db()
+            self.assertEqual(event.participants_count, 1)
+
+        with self.subTest("full"):
+            self.assertEqual(self.client.put(join_url, {'userId': third.id}).status_code, 201)
+            response = self.client.put(join_url, {'userId': self.user.id})
+            self.assertEqual(response.status_code, 406)
+            self.assertFalse(event.joined_by.filter(id=self.user.id).exists())
+            event.refresh_from_db()
+            self.assertEqual(event.participants_count, 2)
+
+        with self.subTest("cancel"):
+            self.assertEqual(self.client.put(cancel_url, {'userId': other.id}).status_code, 201)
+            self.assertEqual(self.client.put(cancel_url, {'userId': other.id}).status_code, 400)
+            event.refresh_from_db()
+            self.assertEqual(event.participants_count, 1)
+
+        with self.subTest("related manager"):
+            event.joined_by.add(other, self.user)
+            other.joined_events.clear()
+            event.refresh_from_db()
+            self.assertEqual(event.participants_count, 2)
+
+    def test_rating_aggregates(self):
+        event = self._create_event()
+        other_event = self._create_event(name="Evento senza voti")
+        other = CustomUser.objects.create(email='other@user.it', password='mypassword')
+        event.joined_by.add(self.user, other)
+
+        def rate(user, method, url_name, data=None):
+            self.client.force_authenticate(user)
+            return getattr(self.client, method)(reverse(url_name, args=[event.pk]), data, format='json')
+
+        with self.subTest("rate"):
+            self.assertEqual(rate(self.user, 'post', 'events-rate', {'rating': '4.0'}).status_code, 201)
+            self.assertEqual(rate(other, 'post', 'events-rate', {'rating': '3.5'}).status_code, 201)
+            event.refresh_from_db()
+            self.assertEqual(event.rating_count, 2)
+            self.assertEqual(event.rating_avg, Decimal('3.75'))
+            self.assertEqual(event.rating_histogram[8], 1)
+            self.assertEqual(event.rating_histogram[7], 1)
+
+        with self.subTest("update and delete"):
+            self.assertEqual(rate(other, 'put', 'events-update-rating', {'rating': '5.0'}).status_code, 200)
+            self.assertEqual(rate(self.user, 'delete', 'events-delete-rating').status_code, 204)
+            event.refresh_from_db()
+            self.assertEqual(event.rating_count, 1)
+            self.assertEqual(event.rating_avg, Decimal('5.00'))
+            self.assertEqual(sum(event.rating_histogram), 1)
+            self.assertEqual(event.rating_histogram[10], 1)
+
+        with self.subTest("serializer and ordering"):
+            response = self.client.get(reverse('events-search-events'), {'ordering': 'rating'})
+            self.assertEqual([e['id'] for e in response.data['results']], [event.id, other_event.id])
+            self.assertEqual(response.data['results'][0]['rating_avg'], '5.00')
+            self.assertNotIn('rating_sum', response.data['results'][0])
+
+        with self.subTest("reconcile"):
+            Event.objects.filter(pk=event.pk).update(rating_count=0, rating_avg=0, rating_histogram=empty_rating_histogram())
+            out = StringIO()
+            call_command('reconcile_ratings', stdout=out)
+            self.assertIn('1', out.getvalue())
+            event.refresh_from_db()
+            self.assertEqual((event.rating_count, event.rating_avg, event.rating_histogram[10]), (1, Decimal('5.00'), 1))
+
+    def test_list_query_count_is_constant(self):
+        others = [CustomUser.objects.create(email=f'user{i}@user.it', password='mypassword', first_name='Utente') for i in range(3)]
+        self.client.force_authenticate(self.user)
+        urls = [
+            (reverse('events-list'), {}),
+            (reverse('events-list-public'), {'count': 'false'}),
+            (reverse('events-search-events'), {'q': 'evento', 'count': 'false'}),
+            (reverse('auth-user-events'), {'count': 'false'}),
+        ]
+
+        def query_counts():
+            counts = []
+            for url, params in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200, response.data)
+                counts.append(len(queries))
+            return counts
+
+        self._create_event(name="Evento uno")
+        baseline = query_counts()
+
+        for i in range(6):
+            event = self._create_event(name=f"Evento {i}")
+            event.joined_by.add(*others)
+            Rating.objects.bulk_create(Rating(event=event, user=user, rating=4) for user in others)
+        self.assertEqual(query_counts(), baseline)
+
+        response = self.client.get(reverse('events-list-public'))
+        rated = next(e for e in response.data['results'] if e['ratings'])
+        self.assertEqual(len(rated['ratings']), 3)
+        self.assertEqual(len(rated['joined_by']), 3)
+
+    def test_sparse_fieldsets(self):
+        event = self._create_event(description="x" * 1000)
+        event.joined_by.add(self.user)
+        self.client.force_authenticate(self.user)
+        url = reverse('events-list-public')
+
+        with self.subTest("card"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'view': 'card', 'count': 'false'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data['results'][0]), set(CARD_FIELDS))
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('description', queries[0]['sql'])
+
+        with self.subTest("fields"):
+            response = self.client.get(reverse('auth-user-events'), {'fields': 'name,joined_by'})
+            self.assertEqual(response.data['results'][0], {'name': event.name, 'joined_by': [self.user.id]})
+
+        with self.subTest("unknown field"):
+            response = self.client.get(url, {'fields': 'name,secret'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_public_listing_cache(self):
+        response_cache_counts.clear()
+        event = self._create_event(name="Evento in cache")
+        url = reverse('events-list-public')
+
+        with self.subTest("hit skips the database"):
+            self.assertEqual(self.client.get(url, {'count': 'false', 'view': 'card'})['X-Cache'], 'MISS')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'view': 'card', 'count': 'false'})
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertEqual(len(queries), 0)
+            self.assertEqual([e['id'] for e in response.data['results']], [event.id])
+
+        with self.subTest("writes invalidate"):
+            other = self._create_event(name="Nuovo evento")
+            response = self.client.get(url, {'view': 'card', 'count': 'false'})
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual([e['id'] for e in response.data['results']], [other.id, event.id])
+
+            participant = CustomUser.objects.create(email='other@user.it', password='mypassword')
+            self.client.force_authenticate(self.user)
+            self.client.put(reverse('events-join', args=[event.pk]), {'userId': participant.id})
+            self.client.force_authenticate(None)
+            response = self.client.get(url, {'view': 'card', 'count': 'false'})
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(response.data['results'][1]['participants_count'], 1)
+
+        with self.subTest("stats"):
+            self.user.is_staff = True
+            self.user.save()
+            self.client.force_authenticate(self.user)
+            stats = self.client.get(reverse('events-cache-stats')).data
+            self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_conditional_get(self):
+        event = self._create_event()
+        url = reverse('events-detail', args=[event.pk])
+
+        with self.subTest("detail"):
+            response = self.client.get(url)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(len(queries), 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with self.subTest("detail changes with participants"):
+            participant = CustomUser.objects.create(email='other@user.it', password='mypassword')
+            self.client.force_authenticate(self.user)
+            self.client.put(reverse('events-join', args=[event.pk]), {'userId': participant.id})
+            self.client.force_authenticate(None)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+        with self.subTest("list"):
+            list_url = reverse('events-list-public')
+            etag = self.client.get(list_url)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(len(queries), 0)
+            self._create_event(name="Nuovo evento")
+            self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_reads(self):
+        event = self._create_event()
+        detail_url = reverse('events-detail', args=[event.pk])
+        favorite_url = reverse('events-is-favorite', args=[event.pk])
+
+        with self.subTest("ratings"):
+            Rating.objects.create(event=event, user=self.user, rating=4, review='Bello')
+            response = self.client.get(reverse('events-ratings', args=[event.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([r['userId'] for r in response.json()], [self.user.id])
+            self.assertEqual(self.client.get(reverse('events-ratings', args=[0])).status_code, 404)
+            self.assertEqual(self.client.get(reverse('events-ratings', args=['abc'])).status_code, 404)
+
+        with self.subTest("is_favorite"):
+            response = self.client.get(favorite_url)
+            self.assertEqual(response.status_code, 401)
+            self.assertIn('WWW-Authenticate', response)
+            self.client.force_authenticate(self.user)
+            self.assertEqual(self.client.get(favorite_url).json(), {'isFavorite': False})
+            self.client.post(reverse('events-toggle-favorite', args=[event.pk]))
+            self.assertEqual(self.client.get(favorite_url).json(), {'isFavorite': True})
+
+        with self.subTest("update"):
+            response = self.client.patch(detail_url, {'description': 'Nuova descrizione'})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(self.client.get(detail_url).json()['description'], 'Nuova descrizione')
+
+    async def test_async_client(self):
+        event = await sync_to_async(self._create_event)()
+        response = await self.async_client.get(reverse('events-list-public'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['id'] for e in response.json()['results']], [event.id])
+        response = await self.async_client.get(reverse('events-detail', args=[event.pk]))
+        self.assertEqual(response.json()['name'], event.name)
+
+    def test_bulk_participants(self):
+        event = self._create_event(max_participants=20)
+        event.joined_by.add(self.user)
+        guests = CustomUser.objects.bulk_create(
+            CustomUser(email=f'guest{i}@user.it', password='mypassword') for i in range(25)
+        )
+        CustomUser.objects.filter(pk=guests[1].pk).update(can_join=False)
+        add_url = reverse('events-add-participants', args=[event.pk])
+        remove_url = reverse('events-remove-participants', args=[event.pk])
+        self.client.force_authenticate(self.user)
+
+        with self.subTest("add"):
+            users = [guests[0].id, guests[0].email, guests[1].id, 'missing@user.it'] + [guest.email for guest in guests[2:]]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(add_url, {'users': users}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertLessEqual(len(queries), 10)
+            statuses = [result['status'] for result in response.data['results']]
+            self.assertEqual(statuses[:4], ['added', 'already_joined', 'not_allowed', 'not_found'])
+            self.assertEqual(statuses.count('added'), 19)
+            self.assertEqual(statuses.count('event_full'), 5)
+            self.assertEqual(response.data['participants_count'], 20)
+            self.assertEqual(event.joined_by.count(), 20)
+
+        with self.subTest("remove"):
+            response = self.client.post(remove_url, {'users': [self.user.id, guests[0].id, guests[1].email]}, format='json')
+            self.assertEqual([r['status'] for r in response.data['results']], ['organizer', 'removed', 'not_joined'])
+            self.assertEqual(response.data['participants_count'], 19)
+
+        with self.subTest("organizer only"):
+            self.client.force_authenticate(guests[3])
+            self.assertEqual(self.client.post(add_url, {'users': [guests[4].id]}, format='json').status_code, 403)
+
+    def test_participants_roster(self):
+        event = self._create_event()
+        guests = CustomUser.objects.bulk_create(
+            CustomUser(email=f'guest{i}@user.it', password='mypassword', first_name=f'Guest {i}') for i in range(12)
+        )
+        start = timezone.now()
+        Participation.objects.bulk_create(
+            Participation(event=event, user=guest, joined_at=start + datetime.timedelta(minutes=i))
+            for i, guest in enumerate(guests)
+        )
+        url = reverse('events-participants', args=[event.pk])
+
+        with self.subTest("paginated in join order"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'count': 'false'})
+            self.assertEqual(response.status_code, 200)
+            # Evento e pagina di partecipanti, utenti compresi
+            self.assertEqual(len(queries), 2)
+            first_page = response.data['results']
+            self.assertEqual([p['userId'] for p in first_page], [guest.id for guest in guests[:10]])
+            self.assertEqual(first_page[0]['first_name'], 'Guest 0')
+            self.assertEqual(first_page[0]['status'], Participation.Status.JOINED)
+            response = self.client.get(response.data['next'])
+            self.assertEqual([p['userId'] for p in response.data['results']], [guest.id for guest in guests[10:]])
+
+        with self.subTest("cancel participation"):
+            Event.objects.filter(pk=event.pk).recount_participants()
+            self.client.force_authenticate(guests[0])
+            url = reverse('events-cancel-participation', args=[event.pk])
+            self.assertEqual(self.client.delete(url).status_code, 204)
+            self.assertEqual(self.client.delete(url).status_code, 400)
+            self.assertEqual(Event.objects.get(pk=event.pk).participants_count, 11)
+
+    def test_streaming_exports(self):
+        event = self._create_event(tags=['musica', 'jazz'])
+        self._create_event(name='Evento, con virgola')
+        event.joined_by.add(self.user)
+        Rating.objects.create(event=event, user=self.user, rating=4.5, review='Bello')
+        admin = CustomUser.objects.create(email='admin@user.it', password='mypassword', is_staff=True)
+
+        with self.subTest("admin only"):
+            self.client.force_authenticate(self.user)
+            self.assertEqual(self.client.get(reverse('events-view-all-events')).status_code, 403)
+
+        self.client.force_authenticate(admin)
+        with self.subTest("events as a json array by default"), mock.patch('events.exports.EXPORT_CHUNK_SIZE', 1):
+            response = self.client.get(reverse('events-view-all-events'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            rows = json.loads(b''.join(response.streaming_content))
+            # La stessa rappresentazione della lista non in streaming di prima
+            self.assertEqual(rows, EventSerializer(
+                Event.objects.order_by('id'), many=True, context={'request': response.wsgi_request},
+            ).data)
+            self.assertEqual(rows[0]['ratings'][0]['review'], 'Bello')
+
+        with self.subTest("events as ndjson"):
+            response = self.client.get(reverse('events-view-all-events'), {'output': 'ndjson'})
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+            self.assertEqual([row['id'] for row in rows], sorted(Event.objects.values_list('id', flat=True)))
+            self.assertEqual(rows[0]['tags'], ['musica', 'jazz'])
+
+        with self.subTest("events as csv"):
+            response = self.client.get(reverse('events-view-all-events'), {'output': 'csv'})
+            rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+            self.assertEqual(rows[0][:2], ['id', 'name'])
+            self.assertEqual(rows[2][1], 'Evento, con virgola')
+
+        with self.subTest("participants and ratings of one event"):
+            response = self.client.get(reverse('events-export-participants'), {'event': event.pk, 'output': 'csv'})
+            rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+            self.assertEqual(rows[0], ['id', 'event_id', 'user_id', 'user_email', 'joined_at', 'status'])
+            self.assertEqual(rows[1][3], self.user.email)
+            response = self.client.get(reverse('events-export-ratings'), {'event': event.pk})
+            self.assertEqual(json.loads(b''.join(response.streaming_content))[0]['rating'], '4.5')
+
+        with self.subTest("unknown format"):
+            self.assertEqual(self.client.get(reverse('events-view-all-events'), {'output': 'xml'}).status_code, 400)
+
+    async def test_streaming_exports_under_asgi(self):
+        events = [await sync_to_async(self._create_event)(name=f'Evento {i}') for i in range(3)]
+        admin = await CustomUser.objects.acreate(email='admin@user.it', password='mypassword', is_staff=True)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(admin)}'}
+        with mock.patch('events.exports.EXPORT_CHUNK_SIZE', 2):
+            response = await self.async_client.get(reverse('events-view-all-events'), headers=headers)
+            self.assertEqual(response.status_code, 200)
+            # Un iteratore async: la risposta non viene letta tutta prima di partire
+            self.assertTrue(response.is_async)
+            content = b''.join([piece async for piece in response.streaming_content])
+        self.assertEqual([row['name'] for row in json.loads(content)], [event.name for event in events])
+
+
+class TestConcurrentJoin(TransactionTestCase):
+
+    def test_concurrent_joins_respect_max_participants(self):
+        owner = CustomUser.objects.create(email='owner@user.it', password='mypassword')
+        users = [CustomUser.objects.create(email=f'user{i}@user.it', password='mypassword') for i in range(12)]
+        date = timezone.now() + datetime.timedelta(days=7)
+        event = Event.objects.create(
+            name='Evento affollato', description='', price=0, category=1, place='Napoli',
+            event_date=date, participation_deadline=date, created_by=owner, max_participants=5,
+        )
+        barrier = threading.Barrier(len(users))
+        statuses = []
+
+        def join(user):
+            client = APIClient()
+            client.force_authenticate(owner)
+            barrier.wait()
+            try:
+                statuses.append(client.put(reverse('events-join', args=[event.pk]), {'userId': user.id}).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=join, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        event.refresh_from_db()
+        self.assertEqual(statuses.count(201), 5)
+        self.assertEqual(statuses.count(406), 7)
+        self.assertEqual(event.participants_count, 5)
+        self.assertEqual(event.joined_by.count(), 5)
+
+
+class TestFuzzyThreshold(TransactionTestCase):
+
+    def test_threshold_does_not_outlive_the_request(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW pg_trgm.word_similarity_threshold')
+            default = cursor.fetchone()[0]
+        for api_url in (reverse('events-search-events'), '/api/v1/users/search/'):
+            with self.subTest(api_url):
+                params = {'place': 'Romaa', 'q': 'Rossii', 'fuzzy': 'true'}
+                self.assertEqual(self.client.get(api_url, params).status_code, 200)
+                # Con set_config di sessione la soglia resterebbe sulla connessione del pool
+                with connection.cursor() as cursor:
+                    cursor.execute('SHOW pg_trgm.word_similarity_threshold')
+                    self.assertEqual(cursor.fetchone()[0], default)
+
+
+class TestSharedCache(TestCase):
+
+    def test_command_invalidation_reaches_other_processes(self):
+        owner = CustomUser.objects.create(email='owner@user.it', password='mypassword')
+        date = timezone.now() + datetime.timedelta(days=7)
+        event = Event.objects.create(
+            name='Evento', description='', price=0, category=1, place='Napoli',
+            event_date=date, participation_deadline=date, created_by=owner,
+        )
+        # Aggregati dei voti che non corrispondono a events_rating
+        Event.objects.filter(pk=event.pk).update(rating_count=3, rating_sum=12)
+        before = events_version()
+        call_command('reconcile_ratings', stdout=StringIO())
+        # La versione è su file, dove la leggono anche gli altri processi
+        self.assertTrue(os.path.exists(cache._key_to_file(VERSION_KEY)))
+        self.assertNotEqual(caches.create_connection('default').get(VERSION_KEY), before)
+
+
+# Le URL degli eventi come sotto joinit.asgi (ASYNC_CACHED_READS)
+urlpatterns = [path('api/v1/', include(with_cached_reads(router.urls)))]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TestCachedReads(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_hits_served_by_the_async_view(self):
+        owner = await CustomUser.objects.acreate(email='owner@user.it', password='mypassword')
+        date = timezone.now() + datetime.timedelta(days=7)
+        event = await Event.objects.acreate(
+            name='Evento', description='', price=0, category=1, place='Napoli',
+            event_date=date, participation_deadline=date, created_by=owner,
+        )
+        url = reverse('events-list-public')
+
+        with self.subTest("miss goes to the viewset"):
+            response = await self.async_client.get(url, {'count': 'false'})
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertIsInstance(response, Response)
+            expected = response.json()
+            self.assertEqual([e['id'] for e in expected['results']], [event.id])
+
+        with self.subTest("hit served without DRF"):
+            response = await self.async_client.get(url, {'count': 'false'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertNotIsInstance(response, Response)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('Accept', response['Vary'])
+            self.assertEqual(response.json(), expected)
+            etag = response['ETag']
+            response = await self.async_client.get(url, {'count': 'false'}, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+        with self.subTest("authenticated requests go through DRF"):
+            response = await self.async_client.get(url, {'count': 'false'}, headers={'Authorization': 'Bearer invalid'})
+            self.assertEqual(response.status_code, 401)
+
+        with self.subTest("other formats go through DRF"):
+            response = await self.async_client.get(url, {'count': 'false'}, headers={'Accept': 'text/html'})
+            self.assertIsInstance(response, Response)
+            self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
@@ -1,7 +1,13 @@
+from django.conf import settings
 from rest_framework.routers import SimpleRouter
+from .async_views import with_cached_reads
 from .views import EventViewSet
 
 router = SimpleRouter()
 router.register(r'events', EventViewSet, basename="events")
 
 urlpatterns = router.urls
+
+if settings.ASYNC_CACHED_READS:
+    # Sotto ASGI gli hit delle liste più lette non passano da un thread
+    urlpatterns = with_cached_reads(urlpatterns)
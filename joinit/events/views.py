@@ -6,10 +6,21 @@ from rest_framework.decorators import action
 from rest_framework.schemas.openapi import AutoSchema
 from rest_framework.exceptions import PermissionDenied
 
-from django.db.models import Q
+from django.db import transaction
 from users.models import CustomUser
-from .models import Event, Rating, Favorite
-from .serializers import EventSerializer, RatingSerializer, FavoriteSerializer
+from .models import Event, FeedUpdate, Participation, Rating, Favorite, TagCount
+from .serializers import EventSerializer, ParticipationSerializer, RatingSerializer, FavoriteSerializer, TagCountSerializer
+from .caching import (
+    EVENT_STATE_FIELDS, add_validators, cached_response, event_etag, invalidate_events_cache,
+    not_modified, response_cache_stats,
+)
+from .exports import export_format, export_response
+from .feeds import feed_events, feed_items
+from .fieldsets import narrow_queryset, requested_fields
+from .maps import map_clusters, map_payload
+from .pagination import KeysetPagination
+from .participants import BULK_LIMIT, add_participants, join_event, leave_event, remove_participants
+from .search import fuzzy_threshold, is_fuzzy, search_queryset
 from rest_framework.exceptions import ValidationError
 from django.utils.timezone import now
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -23,6 +34,41 @@ class EventViewSet(ModelViewSet):
     permission_classes = [AllowAny]
     schema = AutoSchema(tags=['Events'])
     parser_classes = [MultiPartParser, FormParser,JSONParser]
+    # Liste che accettano ?fields= e ?view=card
+    sparse_actions = ('list', 'list_public', 'search_events', 'favorites', 'feed', 'recommended')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.for_listing()
+        if self.action in self.sparse_actions:
+            queryset = narrow_queryset(queryset, requested_fields(self.request))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.setdefault('fields', requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Richieste condizionali (If-None-Match / If-Modified-Since): lo stato
+        dell'evento si legge con una lookup per chiave primaria, e se non è
+        cambiato si risponde 304 senza caricare né serializzare l'evento.
+        """
+        try:
+            state = Event.objects.filter(pk=kwargs['pk']).values(*EVENT_STATE_FIELDS).first()
+        except ValueError:
+            state = None
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = event_etag(request, state)
+        last_modified = int(state['last_modified_ts'].timestamp())
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        return add_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
 
     def update(self, request, *args, **kwargs):
 
@@ -62,7 +108,10 @@ class EventViewSet(ModelViewSet):
             image = self.request.FILES['cover_image']
             if not image.name.lower().endswith(('.png', '.jpg', '.jpeg')):
                 raise ValidationError("Cover image must be a PNG, JPG, or JPEG file.")
-        serializer.save(created_by=self.request.user)
+        with transaction.atomic():
+            event = serializer.save(created_by=self.request.user)
+            # Aggiunto alle feed degli interessati fuori dalla richiesta (process_feed_updates)
+            FeedUpdate.objects.queue_event(event.pk)
 
     @action(detail=True, methods=['DELETE'], permission_classes=[IsAuthenticated])
     def remove_cover_image(self, request, pk=None):
@@ -71,39 +120,100 @@ class EventViewSet(ModelViewSet):
         """
         event = self.get_object()
         if event.cover_image:
-            event.cover_image.delete(save=True)
+            # Il file viene rimosso dal blob store solo quando nessuno lo usa più
             event.cover_image = None
             event.save()
             return Response({'detail': 'Cover image removed successfully.'}, status=status.HTTP_204_NO_CONTENT)
         return Response({'detail': 'No cover image to remove.'}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['GET'])
+    @cached_response
     def event_types(self, request):
         event_types_choices = [choice[1] for choice in Event.EventType.choices]
         return Response(event_types_choices, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['GET'])
+    def tags(self, request):
+        """
+        Autocompletamento dei tag: i più usati che iniziano con ``prefix``,
+        letti dai contatori precalcolati senza toccare la tabella degli eventi.
+        """
+        prefix = request.query_params.get('prefix', '').strip().casefold()
+        tags = TagCount.objects.filter(event_count__gt=0)
+        if prefix:
+            tags = tags.filter(tag__startswith=prefix)
+        serializer = TagCountSerializer(tags.order_by('-event_count', 'tag')[:10], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """Hit e miss della cache delle risposte e versione corrente degli eventi."""
+        return Response(response_cache_stats())
+
     @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
     def view_all_events(self, request):
-        events = Event.objects.all() 
-        serializer = self.get_serializer(events, many=True)
-        return Response(serializer.data)
+        """Dump di tutti gli eventi in streaming: lista JSON, oppure ``?output=ndjson`` o ``?output=csv``."""
+        return export_response(request, 'events', export_format(request))
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def export_participants(self, request):
+        """Dump delle partecipazioni in streaming, eventualmente di un solo evento (``?event=``)."""
+        return export_response(request, 'participants', export_format(request), **self._export_filters(request))
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def export_ratings(self, request):
+        """Dump dei voti in streaming, eventualmente di un solo evento (``?event=``)."""
+        return export_response(request, 'ratings', export_format(request), **self._export_filters(request))
+
+    def _export_filters(self, request):
+        event_id = request.query_params.get('event')
+        if event_id is None:
+            return {}
+        if not event_id.isdigit():
+            raise ValidationError({'event': 'Must be an event id.'})
+        return {'event_id': int(event_id)}
     
-    @action(detail=False, methods=['GET'])
+    @action(detail=False, methods=['GET'], pagination_class=KeysetPagination)
+    @cached_response
     def list_public(self, request):
         user_id = request.query_params.get('userId')
         
         try:
-            events = Event.objects.filter(Q(is_private=False, cancelled=False) |Q(is_private=True, joined_by__id=user_id)).distinct().order_by('-event_date')
+            events = Event.objects.listed_for(user_id).for_listing().order_by('-event_date', '-id')
+            events = narrow_queryset(events, requested_fields(request))
 
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         page = self.paginate_queryset(events)
-        
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], pagination_class=KeysetPagination)
+    def feed(self, request):
+        """
+        Home personalizzata, precalcolata da build_feeds: una pagina di FeedItem
+        in ordine di punteggio (range scan sull'indice), poi gli eventi per chiave.
+        Finché l'utente non ha una feed, i prossimi eventi visibili in ordine di data.
+        """
+        fields = requested_fields(request)
+        items = feed_items(request.user.id)
+        if items.exists():
+            events = feed_events(self.paginate_queryset(items), fields)
+        else:
+            events = Event.objects.listed_for(request.user.id).filter(event_date__gte=timezone.now())
+            events = self.paginate_queryset(narrow_queryset(events.for_listing().order_by('event_date', 'id'), fields))
         serializer = self.get_serializer(events, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'], url_path='map', url_name='map')
+    @cached_response
+    def events_map(self, request):
+        """
+        Marker della mappa nel viewport ``bbox`` raggruppati per cella della
+        griglia di ``zoom``: la risposta non cresce con il numero di eventi.
+        """
+        size, clusters = map_clusters(request.query_params)
+        return Response(map_payload(request.query_params, size, clusters))
 
     @action(detail=True, methods=['PUT'])
     def join(self, request, pk=None):
@@ -116,15 +226,11 @@ class EventViewSet(ModelViewSet):
             if event.participation_deadline < timezone.now():
                 return Response({'detail': 'Event participation deadline has passed.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if event.joined_by.filter(id=user.id).exists():
+            result = join_event(event, user.id)
+            if result == 'already_joined':
                 return Response({'detail': 'You have already joined this event.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            if event.joined_by.count() >= event.max_participants:
+            if result == 'event_full':
                 return Response({'detail': 'Maximum number of participants reached.'}, status=status.HTTP_406_NOT_ACCEPTABLE)
-
-
-            event.joined_by.add(user)
-            event.save()
         except (CustomUser.DoesNotExist, Exception) as e:
             if isinstance(e, CustomUser.DoesNotExist):
                 return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)    
@@ -138,14 +244,11 @@ class EventViewSet(ModelViewSet):
         try:
             user = CustomUser.objects.get(id=request.data['userId'])
             
-            if not event.joined_by.filter(id=user.id).exists():
-                return Response({'detail': 'You have not joined this event.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if event.created_by.id == user.id:
+            result = leave_event(event, user.id)
+            if result == 'organizer':
                 return Response({'detail': 'You cannot cancel your own event.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            event.joined_by.remove(user)
-            event.save()
+            if result == 'not_joined':
+                return Response({'detail': 'You have not joined this event.'}, status=status.HTTP_400_BAD_REQUEST)
         except (CustomUser.DoesNotExist, Exception) as e:
             if isinstance(e, CustomUser.DoesNotExist):
                 return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)    
@@ -153,11 +256,60 @@ class EventViewSet(ModelViewSet):
                 return Response({'detail': 'Something went wrong: ' + str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'detail': 'You have successfully cancelled your participation in the event.'}, status=status.HTTP_201_CREATED)
 
-    @action(detail=True, methods=['GET'], permission_classes=[AllowAny])
+    @action(detail=True, methods=['POST'], permission_classes=[IsAuthenticated])
+    def add_participants(self, request, pk=None):
+        """Aggiunge in blocco partecipanti (id o email) a un evento; solo per l'organizzatore."""
+        return self._bulk_participants(request, add_participants)
+
+    @action(detail=True, methods=['POST'], permission_classes=[IsAuthenticated])
+    def remove_participants(self, request, pk=None):
+        """Toglie in blocco partecipanti (id o email) da un evento; solo per l'organizzatore."""
+        return self._bulk_participants(request, remove_participants)
+
+    def _bulk_participants(self, request, operation):
+        event = self.get_object()
+        if event.created_by_id != request.user.id:
+            raise PermissionDenied("Solo il creatore dell'evento può gestirne i partecipanti.")
+        if event.cancelled:
+            return Response({'detail': 'The event has been cancelled.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = request.data.get('users')
+        if not isinstance(users, list) or not users:
+            return Response({'detail': 'users must be a non-empty list of user ids or emails.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(users) > BULK_LIMIT:
+            return Response({'detail': f'At most {BULK_LIMIT} users per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = operation(event.pk, users)
+        participants_count = Event.objects.filter(pk=event.pk).values_list('participants_count', flat=True).get()
+        return Response({'results': results, 'participants_count': participants_count})
+
+    @action(detail=True, methods=['GET'], permission_classes=[AllowAny], pagination_class=KeysetPagination)
     def participants(self, request, pk=None):
+        """Partecipanti in ordine di iscrizione: una query per pagina sull'indice (event, joined_at)."""
+        event = self.get_object()
+        participations = (
+            Participation.objects.filter(event_id=event.pk)
+            .select_related('user')
+            .only('id', 'event_id', 'joined_at', 'status', 'user__id', 'user__first_name', 'user__last_name', 'user__profile_picture')
+            .order_by('joined_at', 'id')
+        )
+        page = self.paginate_queryset(participations)
+        serializer = ParticipationSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'], permission_classes=[AllowAny])
+    @cached_response
+    def recommended(self, request, pk=None):
+        """
+        Eventi simili per partecipanti e preferiti in comune, precalcolati da
+        build_recommendations: solo quelli ancora pubblici, non annullati e futuri.
+        """
         event = self.get_object()
-        participants = Participation.objects.filter(event=event)
-        serializer = ParticipationSerializer(participants, many=True)
+        events = Event.objects.filter(
+            recommended_for__event_id=event.pk, is_private=False, cancelled=False, event_date__gte=timezone.now(),
+        ).for_listing().order_by('recommended_for__rank')
+        events = narrow_queryset(events, requested_fields(request))
+        serializer = self.get_serializer(events, many=True)
         return Response(serializer.data)
     
 
@@ -178,13 +330,15 @@ class EventViewSet(ModelViewSet):
 
         serializer = RatingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=user, event=event)
+        with transaction.atomic():
+            rating = serializer.save(user=user, event=event)
+            Event.objects.apply_rating(event.pk, added=rating.rating)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['GET'], permission_classes=[AllowAny])
     def ratings(self, request, pk=None):
         event = self.get_object()
-        ratings = Rating.objects.filter(event=event)
+        ratings = Rating.objects.filter(event=event).select_related('user')
         serializer = RatingSerializer(ratings, many=True)
         return Response(serializer.data)
 
@@ -197,19 +351,23 @@ class EventViewSet(ModelViewSet):
         if not user.can_comment:
             return Response({'detail': 'You are not allowed to comment or rate events.'}, status=status.HTTP_403_FORBIDDEN)
     
-        existing_rating = Rating.objects.filter(user=user, event=event).first()
-        if not existing_rating:
-            return Response({'detail': 'You have not rated this event yet.'}, status=status.HTTP_400_BAD_REQUEST)
-    
-        rating_data = {
-            'rating': request.data.get('rating'),
-            'review': request.data.get('review', existing_rating.review)
-        }
-
-        serializer = RatingSerializer(existing_rating, data=rating_data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({'detail': 'Rating updated successfully.', 'rating': serializer.data}, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            existing_rating = Rating.objects.select_for_update().filter(user=user, event=event).first()
+            if not existing_rating:
+                return Response({'detail': 'You have not rated this event yet.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            rating_data = {
+                'rating': request.data.get('rating'),
+                'review': request.data.get('review', existing_rating.review)
+            }
+
+            previous = existing_rating.rating
+            serializer = RatingSerializer(existing_rating, data=rating_data, partial=True)
+            if serializer.is_valid():
+                rating = serializer.save()
+                # Anche se cambia solo la recensione: aggiorna last_modified_ts dell'evento
+                Event.objects.apply_rating(event.pk, added=rating.rating, removed=previous)
+                return Response({'detail': 'Rating updated successfully.', 'rating': serializer.data}, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -219,78 +377,40 @@ class EventViewSet(ModelViewSet):
         user = request.user  
 
         try:
-            rating = Rating.objects.filter(user=user, event=event).first()
+            with transaction.atomic():
+                rating = Rating.objects.select_for_update().filter(user=user, event=event).first()
 
-            if not rating:
-                return Response({'detail': 'You have not rated this event.'}, status=status.HTTP_404_NOT_FOUND)
+                if not rating:
+                    return Response({'detail': 'You have not rated this event.'}, status=status.HTTP_404_NOT_FOUND)
 
-            rating.delete()  
+                rating.delete()
+                Event.objects.apply_rating(event.pk, removed=rating.rating)
             return Response({'detail': 'Your rating has been deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
 
         except Exception as e:
             return Response({'detail': f'An error occurred: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=False, methods=['GET'], url_path='search')
+    @action(detail=False, methods=['GET'], url_path='search', pagination_class=KeysetPagination)
+    @cached_response
     def search_events(self, request):
-        z = request.query_params
-        filters = Q(cancelled=False)
-
-        if 'q' in z and z['q'].strip():
-            q = z['q'].strip()
-            category_mapping = {label.lower(): value for value, label in Event.EventType.choices}
-            category_value = category_mapping.get(q.lower())
-            tag_list = [tag.strip() for tag in q.split(',')]
-            filters &= (
-                Q(name__icontains=q) |
-                Q(tags__overlap=tag_list) |
-                (Q(category=category_value) if category_value is not None else Q())
-            )
-
-        if 'place' in z and z['place'].strip():
-            filters &= Q(place__icontains=z['place'])
-        if 'name' in z and z['name'].strip():
-            filters &= Q(name__icontains=z['name'].strip())
-        if 'category' in z and z['category'].isdigit():
-            filters &= Q(category=int(z['category']))
-        if 'max_price' in z and z['max_price'].replace('.', '', 1).isdigit():
-            filters &= Q(price__lte=float(z['max_price']))
-        if 'max_participants' in z and z['max_participants'].isdigit():
-            filters &= Q(max_participants__lte=int(z['max_participants']))
-        if 'tags' in z and z['tags'].strip():
-            tag_list = [tag.strip() for tag in z['tags'].split(',')]
-            filters &= Q(tags__overlap=tag_list)
-
-        user_id = request.query_params.get('userId')  
-        if user_id:
-            event_filters = Q(
-                Q(is_private=False) |
-                Q(is_private=True, joined_by__id=user_id) |
-                Q(is_private=True, created_by__id=user_id)
-            )
-            filters &= event_filters
-        else:
-            filters &= Q(is_private=False)
-
-        events = Event.objects.filter(filters).distinct().order_by('-event_date')
-        print("Events found:", events.count())
-
-        page = self.paginate_queryset(events)
-        if page is not None:
-            serialized_objs = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serialized_objs.data)
-
-        serialized_objs = self.get_serializer(events, many=True)
-        return Response(serialized_objs.data)
+        events = search_queryset(request.query_params)
+        events = narrow_queryset(events, requested_fields(request))
+
+        # La soglia vale solo nella sua transazione: conteggio e pagina dentro
+        with fuzzy_threshold(is_fuzzy(request)):
+            page = self.paginate_queryset(events)
+        serialized_objs = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serialized_objs.data)
     
     @action(detail=True, methods=['delete'], permission_classes=[IsAuthenticated])
     def cancel_participation(self, request, pk=None):
         event = self.get_object()
-        try:
-            participation = Participation.objects.get(user=request.user, event=event)
-            participation.delete() 
-            return Response({'status': 'Your participation has been cancelled.'}, status=status.HTTP_204_NO_CONTENT)
-        except Participation.DoesNotExist:
+        result = leave_event(event, request.user.id)
+        if result == 'organizer':
+            return Response({'error': 'You cannot cancel your own event.'}, status=status.HTTP_400_BAD_REQUEST)
+        if result == 'not_joined':
             return Response({'error': 'You are not participating in this event.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'Your participation has been cancelled.'}, status=status.HTTP_204_NO_CONTENT)
         
 
     @action(detail=True, methods=['POST'], permission_classes=[IsAuthenticated])
@@ -308,8 +428,9 @@ class EventViewSet(ModelViewSet):
 
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
     def favorites(self, request):
-        favorites = Favorite.objects.filter(user=request.user).select_related("event")
-        serializer = EventSerializer([fav.event for fav in favorites], many=True, context={'request': request})
+        events = Event.objects.filter(favorites__user=request.user).for_listing().order_by('favorites__id')
+        events = narrow_queryset(events, requested_fields(request))
+        serializer = self.get_serializer(events, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['GET'], permission_classes=[IsAuthenticated])
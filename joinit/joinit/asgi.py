@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'joinit.settings')
+# Gli hit della cache delle liste più lette nell'event loop (events.async_views)
+os.environ.setdefault('ASYNC_CACHED_READS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,51 @@
+from django.db.backends.postgresql import base
+
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+POOL_DEFAULTS = {'min_size': 2, 'max_size': 20, 'timeout': 10, 'check_idle': 30, 'max_lifetime': 1800}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Backend PostgreSQL con un pool di connessioni per processo, configurato
+    da ``OPTIONS['pool']`` (``True`` o un dict con le chiavi di POOL_DEFAULTS).
+
+    connect() preleva una connessione già aperta e close() la restituisce
+    invece di chiuderla: con CONN_MAX_AGE = 0 ogni richiesta, sotto WSGI o
+    ASGI, tiene una connessione solo finché serve.
+    """
+    creation_class = DatabaseCreation
+
+    @property
+    def pool_options(self):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        return {**POOL_DEFAULTS, **(options if isinstance(options, dict) else {})}
+
+    @property
+    def pool(self):
+        if self.pool_options is None:
+            return None
+        conn_params = self.get_connection_params()
+        key = tuple(sorted((name, value) for name, value in conn_params.items() if name != 'cursor_factory'))
+        return get_pool(key, lambda: super(DatabaseWrapper, self).get_new_connection(conn_params), **self.pool_options)
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.getconn()
+
+    def _close(self):
+        pool = self.pool if self.connection is not None else None
+        if pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
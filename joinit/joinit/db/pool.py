@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+logger = logging.getLogger(__name__)
+
+
+WAITED = object()
+
+
+class PoolTimeout(OperationalError):
+    """Nessuna connessione libera entro ``timeout`` secondi."""
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni psycopg2 condiviso dai thread di un processo.
+
+    Le connessioni libere sono riusate dall'ultima restituita (LIFO), così
+    quelle in eccesso restano inattive e vengono chiuse da ``max_lifetime``.
+    Al prelievo una connessione rimasta libera più di ``check_idle`` secondi
+    viene verificata con ``SELECT 1``; se il pool è pieno si aspetta fino a
+    ``timeout`` secondi che un altro thread ne restituisca una.
+    """
+
+    def __init__(self, connect, min_size=2, max_size=20, timeout=10, check_idle=30, max_lifetime=1800):
+        if not 0 <= min_size <= max_size:
+            raise ValueError('Pool size: expected 0 <= min_size <= max_size.')
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+
+        self._idle = deque()  # (connessione, restituita alle, aperta alle)
+        self._opened_at = {}  # id(connessione) -> aperta alle, anche per quelle in uso
+        self._connecting = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        self._stats = dict.fromkeys((
+            'checkouts', 'connections_opened', 'connections_closed', 'failed_checks',
+            'waits', 'timeouts',
+        ), 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(min_size):
+            connection = self._register(self.connect())
+            self._idle.append((connection, time.monotonic(), self._opened_at[id(connection)]))
+
+    @property
+    def size(self):
+        return len(self._opened_at) + self._connecting
+
+    def _register(self, connection):
+        self._opened_at[id(connection)] = time.monotonic()
+        self._stats['connections_opened'] += 1
+        return connection
+
+    def _discard(self, connection):
+        """Chiude una connessione del pool; va chiamato con il lock preso."""
+        self._opened_at.pop(id(connection), None)
+        self._stats['connections_closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._available.notify()
+
+    def _usable(self, connection, returned_at):
+        if connection.closed or connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """
+        Preleva una connessione. Il lock è tenuto solo per sceglierla:
+        l'apertura e il controllo con ``SELECT 1`` avvengono fuori.
+        """
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._available:
+                entry = self._reserve(started, waited)
+                if entry is WAITED:
+                    if not waited:
+                        self._stats['waits'] += 1
+                    waited = True
+                    continue
+
+            if entry is None:
+                try:
+                    connection = self.connect()
+                finally:
+                    with self._available:
+                        self._connecting -= 1
+                        self._available.notify()
+                with self._lock:
+                    self._register(connection)
+                    self._checked_out(started, waited)
+                return connection
+
+            connection, returned_at, opened_at = entry
+            expired = time.monotonic() - opened_at >= self.max_lifetime
+            if not expired and self._usable(connection, returned_at):
+                with self._lock:
+                    self._checked_out(started, waited)
+                return connection
+            with self._available:
+                if not expired:
+                    self._stats['failed_checks'] += 1
+                self._discard(connection)
+
+    def _reserve(self, started, waited):
+        """
+        Con il lock preso: una connessione libera, ``None`` se se ne può aprire
+        una nuova (il posto resta riservato), altrimenti attende e restituisce ``WAITED``.
+        """
+        if self._closed:
+            raise OperationalError('Connection pool is closed.')
+        if self._idle:
+            return self._idle.pop()
+        if self.size < self.max_size:
+            self._connecting += 1
+            return None
+
+        remaining = started + self.timeout - time.monotonic()
+        if remaining <= 0:
+            self._stats['timeouts'] += 1
+            self._record_wait(started)
+            raise PoolTimeout(f'No database connection available after {self.timeout}s (max_size={self.max_size}).')
+        self._available.wait(remaining)
+        return WAITED
+
+    def _checked_out(self, started, waited):
+        self._stats['checkouts'] += 1
+        if waited:
+            self._record_wait(started)
+
+    def _record_wait(self, waited):
+        duration = time.monotonic() - waited
+        self._wait_total += duration
+        self._wait_max = max(self._wait_max, duration)
+        if duration > 1:
+            logger.warning('Waited %.2fs for a database connection (max_size=%s).', duration, self.max_size)
+
+    def putconn(self, connection):
+        """Restituisce una connessione: se è rimasta a metà di una transazione viene annullata."""
+        try:
+            if not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            reusable = not connection.closed
+        except Exception:
+            reusable = False
+
+        with self._available:
+            opened_at = self._opened_at.get(id(connection))
+            now = time.monotonic()
+            if self._closed or not reusable or opened_at is None or now - opened_at >= self.max_lifetime:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, now, opened_at))
+                self._available.notify()
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            self._available.notify_all()
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._stats['checkouts']
+            return {
+                **self._stats,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self.size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'wait_total_ms': round(self._wait_total * 1000, 1),
+                'wait_avg_ms': round(self._wait_total * 1000 / checkouts, 3) if checkouts else None,
+                'wait_max_ms': round(self._wait_max * 1000, 1),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, **options):
+    """Pool del processo per i parametri di connessione ``key``, creato al primo uso."""
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(connect, **options)
+    return pool
+
+
+def close_pools(dbname=None):
+    """Chiude i pool (solo quelli del database ``dbname``, se indicato)."""
+    with _pools_lock:
+        for key in list(_pools):
+            if dbname is None or dict(key).get('dbname') == dbname:
+                _pools.pop(key).close()
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.items())
+    return [{'database': dict(key).get('dbname'), **pool.stats()} for key, pool in pools]
@@ -0,0 +1,63 @@
+import threading
+
+import psycopg2
+from django.db import connection
+from django.test import SimpleTestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from joinit.db.pool import ConnectionPool, PoolTimeout
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    databases = {'default'}
+
+    def make_pool(self, **options):
+        params = connection.get_connection_params()
+        pool = ConnectionPool(lambda: psycopg2.connect(**params), **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuses_connections(self):
+        pool = self.make_pool(min_size=1, max_size=2)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()['connections_opened'], 1)
+
+    def test_rolls_back_and_discards_broken_connections(self):
+        pool = self.make_pool(min_size=0, max_size=2)
+        conn = pool.getconn()
+        conn.cursor().execute('SELECT 1')
+        pool.putconn(conn)
+        self.assertEqual(conn.get_transaction_status(), TRANSACTION_STATUS_IDLE)
+
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['connections_closed'], 1)
+
+    def test_health_check_on_checkout(self):
+        pool = self.make_pool(min_size=0, max_size=2, check_idle=0)
+        conn = pool.getconn()
+        pid = conn.get_backend_pid()
+        pool.putconn(conn)
+        # Connessione chiusa dal server mentre era libera nel pool
+        other = psycopg2.connect(**connection.get_connection_params())
+        with other, other.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        other.close()
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    def test_waits_then_times_out(self):
+        pool = self.make_pool(min_size=0, max_size=1, timeout=0.2)
+        conn = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        threading.Timer(0.05, pool.putconn, [conn]).start()
+        self.assertIs(pool.getconn(), conn)
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (2, 1))
+        self.assertGreater(stats['wait_max_ms'], 0)
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     
     'rest_framework',
@@ -39,6 +40,8 @@ INSTALLED_APPS = [
     'corsheaders',
     
     # Our apps
+    'blobs',
+    'outbox',
     'users',
     'events'
 ]
@@ -47,7 +50,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
     #    'rest_framework.permissions.IsAuthenticated',
@@ -57,6 +60,26 @@ REST_FRAMEWORK = {
 
 REST_USE_JWT = True
 
+# Soglia di word similarity (pg_trgm) per le ricerche con ?fuzzy=true
+SEARCH_FUZZY_THRESHOLD = 0.45
+
+# Durata (secondi) delle risposte in cache di list_public, search ed event_types
+EVENTS_CACHE_TIMEOUT = 300
+
+# Hit della cache di list_public, search e map serviti da view async (events.async_views).
+# Lo attiva joinit.asgi: sotto WSGI ogni richiesta passerebbe da async_to_sync.
+ASYNC_CACHED_READS = environ.get('ASYNC_CACHED_READS') == '1'
+
+# Durata (secondi) del profilo utente in cache, restituito da login e token_refresh.
+# Il refresh non interroga il database solo se CACHES non è DatabaseCache.
+USER_PROFILE_CACHE_TIMEOUT = 3600
+
+# Cache in memoria degli utenti autenticati (users.authentication.CachedJWTAuthentication).
+# Per processo: un utente disattivato o con la password cambiata resta autenticato
+# negli altri worker per al più AUTH_USER_CACHE_TTL secondi.
+AUTH_USER_CACHE_SIZE = 1000
+AUTH_USER_CACHE_TTL = 60
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
@@ -99,14 +122,43 @@ WSGI_APPLICATION = 'joinit.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Il backend joinit.db è quello di PostgreSQL con un pool di connessioni per processo:
+# CONN_MAX_AGE resta 0 e a fine richiesta la connessione torna nel pool.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'joinit.db',
         'NAME': environ.get('POSTGRES_DB'),
         'USER': environ.get('POSTGRES_USER'),
         'PASSWORD': environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(environ.get('DB_POOL_MAX_SIZE', 20)),
+                # Secondi di attesa di una connessione libera prima dell'errore
+                'timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+            },
+        },
+    }
+}
+
+# Cache
+# Di default su file nella cartella CACHE_LOCATION, condivisa da tutti i worker e dai
+# comandi di gestione dello stesso host (in docker-compose è il volume ``cache``): la
+# versione degli eventi invalidata da reconcile_ratings o build_recommendations vale
+# anche per il server, e un hit non interroga il database. Non serve un servizio esterno.
+# Una cache in memoria (LocMemCache) è per processo e va bene solo con un worker;
+# DatabaseCache trasformerebbe ogni hit in una query.
+
+CACHES = {
+    'default': {
+        'BACKEND': environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': environ.get('CACHE_LOCATION', '/tmp/joinit-cache'),
+        'OPTIONS': {
+            # Una risposta per combinazione di parametri: il limite predefinito (300) è basso
+            'MAX_ENTRIES': int(environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
     }
 }
 
@@ -21,6 +21,9 @@ from rest_framework.schemas import get_schema_view
 from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+
+from joinit.db.views import db_pool_stats
 
 base_url = "api/v1/"
 
@@ -30,7 +33,10 @@ urlpatterns = [
     path('', TemplateView.as_view(template_name="docs.html", extra_context={"schema_url": 'openapi-schema'}), name="swagger-ui"),
     path(base_url + 'users/', include('users.urls')),
     path(base_url, include('events.urls')),
+    path(base_url + 'db_pool_stats/', db_pool_stats, name='db-pool-stats'),
 ]
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # uvicorn, a differenza di runserver, non serve gli static (admin, docs)
+    urlpatterns += staticfiles_urlpatterns()
@@ -0,0 +1,65 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from outbox.models import OutgoingEmail
+
+UPDATE_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+
+
+class Command(BaseCommand):
+    help = (
+        "Invia le email accodate in OutgoingEmail a lotti, su un'unica connessione "
+        "al server di posta, riprovando con attese crescenti quelle fallite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Email bloccate e inviate per lotto.')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Tentativi prima di segnare un\'email come fallita.')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Secondi di attesa quando la coda è vuota.')
+        parser.add_argument('--once', action='store_true', help='Svuota la coda e termina invece di restare in ascolto.')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        connection.open()
+        sent = failed = 0
+        try:
+            while True:
+                batch_sent, batch_failed, claimed = self.send_batch(connection, options)
+                sent += batch_sent
+                failed += batch_failed
+                if claimed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(f'Email inviate: {sent}, non riuscite: {failed}')
+
+    def send_batch(self, connection, options):
+        """Invia un lotto; le righe restano bloccate fino al commit, così nessun altro worker le riprende."""
+        sent = failed = 0
+        with transaction.atomic():
+            batch = OutgoingEmail.objects.claim(options['batch_size'])
+            for email in batch:
+                try:
+                    connection.send_messages([email.to_message(connection)])
+                except Exception as e:
+                    email.mark_failed(e, options['max_attempts'])
+                    failed += 1
+                    # La connessione potrebbe essere caduta: se ne apre una nuova,
+                    # e se il server non risponde ci riprova il prossimo invio
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass
+                else:
+                    email.mark_sent()
+                    sent += 1
+            OutgoingEmail.objects.bulk_update(batch, UPDATE_FIELDS)
+        return sent, failed, len(batch)
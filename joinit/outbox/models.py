@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.mail import EmailMessage
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+# Attese tra un tentativo e l'altro: 30s, 1m, 2m, ... fino a un'ora
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+class OutgoingEmailQuerySet(models.QuerySet):
+
+    def due(self):
+        """Email da inviare adesso, le più vecchie prima."""
+        return self.filter(
+            status=OutgoingEmail.Status.PENDING, next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at', 'id')
+
+    def claim(self, batch_size):
+        """
+        Blocca un lotto di email da inviare saltando quelle già prese da altri
+        worker (SELECT ... FOR UPDATE SKIP LOCKED). Va chiamato in una transazione.
+        """
+        return list(self.due().select_for_update(skip_locked=True)[:batch_size])
+
+
+class OutgoingEmailManager(models.Manager.from_queryset(OutgoingEmailQuerySet)):
+
+    def queue(self, subject, body, to, headers=None, from_email=''):
+        """Accoda un'email: viene scritta nella transazione corrente e inviata dal worker."""
+        return self.create(subject=subject, body=body, to=list(to), headers=headers or {}, from_email=from_email)
+
+
+class OutgoingEmail(models.Model):
+    """Email in uscita, inviate in blocco dal comando send_queued_emails."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'In attesa'
+        SENT = 'sent', 'Inviata'
+        FAILED = 'failed', 'Fallita'
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = ArrayField(models.EmailField())
+    headers = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutgoingEmailManager()
+
+    class Meta:
+        indexes = [
+            # Solo le email ancora da inviare: l'indice resta piccolo
+            models.Index(fields=['next_attempt_at', 'id'], name='outbox_due_idx', condition=Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)} ({self.status})'
+
+    def to_message(self, connection=None):
+        return EmailMessage(
+            self.subject, self.body, self.from_email or None, self.to,
+            headers=self.headers, connection=connection,
+        )
+
+    def mark_sent(self):
+        self.status = self.Status.SENT
+        self.sent_at = timezone.now()
+        self.attempts += 1
+        self.last_error = ''
+
+    def mark_failed(self, error, max_attempts):
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = self.Status.FAILED
+        else:
+            self.next_attempt_at = timezone.now() + retry_delay(self.attempts)
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from outbox.models import OutgoingEmail
+
+EMAIL_FILE_PATH = tempfile.mkdtemp()
+
+
+class FailingBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP non raggiungibile')
+
+
+class SendQueuedEmailsTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(EMAIL_FILE_PATH, ignore_errors=True)
+
+    def _send(self, *args):
+        call_command('send_queued_emails', '--once', *args, stdout=StringIO())
+
+    def test_sends_in_batches(self):
+        for i in range(3):
+            OutgoingEmail.objects.queue(f'Email {i}', 'Testo', [f'user{i}@joinit.it'])
+        later = OutgoingEmail.objects.queue('Più tardi', 'Testo', ['later@joinit.it'])
+        OutgoingEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        self._send('--batch-size', '2')
+
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ['Email 0', 'Email 1', 'Email 2'])
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.Status.SENT).count(), 3)
+        later.refresh_from_db()
+        self.assertEqual(later.status, OutgoingEmail.Status.PENDING)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend', EMAIL_FILE_PATH=EMAIL_FILE_PATH)
+    def test_file_backend_reuses_one_connection(self):
+        for i in range(3):
+            OutgoingEmail.objects.queue(f'Email {i}', 'Testo', [f'user{i}@joinit.it'], headers={'Content-Type': 'text/html'})
+
+        self._send()
+
+        files = list(Path(EMAIL_FILE_PATH).iterdir())
+        self.assertEqual(len(files), 1)
+        content = files[0].read_text()
+        self.assertEqual(content.count('Subject: Email'), 3)
+        self.assertIn('Content-Type: text/html', content)
+
+    @override_settings(EMAIL_BACKEND='outbox.tests.test_commands.FailingBackend')
+    def test_retries_with_backoff(self):
+        email = OutgoingEmail.objects.queue('Reset', 'Testo', ['user@joinit.it'])
+
+        self._send('--max-attempts', '2')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.Status.PENDING, 1))
+        self.assertIn('SMTP', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        OutgoingEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self._send('--max-attempts', '2')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.Status.FAILED, 2))
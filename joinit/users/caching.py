@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_MISSING = object()
+
+
+def profile_key(user_id):
+    return f'users:profile:{user_id}'
+
+
+def user_profile(user_id):
+    """
+    Dati di UserSerializer per l'utente, dalla cache se possibile: il refresh
+    del token li restituisce senza interrogare il database. Vale con la cache su
+    file (o in memoria) di CACHES; con DatabaseCache un hit è comunque una query.
+    """
+    from .models import CustomUser
+
+    data = cache.get(profile_key(user_id), _MISSING)
+    if data is not _MISSING:
+        return data
+
+    user = CustomUser.objects.filter(id=user_id).first()
+    return cache_user_profile(user) if user is not None else None
+
+
+def cache_user_profile(user):
+    from .serializers import UserSerializer
+
+    data = dict(UserSerializer(user).data)
+    cache.set(profile_key(user.pk), data, settings.USER_PROFILE_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_user_profile(user_id):
+    """Toglie il profilo dalla cache subito e di nuovo al commit (vedi invalidate_events_cache)."""
+    key = profile_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+def populate_home_city(apps, schema_editor):
+    from events.geo import canonical_city
+
+    CustomUser = apps.get_model('users', 'CustomUser')
+    cities = CustomUser.objects.exclude(city__isnull=True).exclude(city='').values_list('city', flat=True).distinct()
+    for city in cities.iterator():
+        CustomUser.objects.filter(city=city).update(home_city=canonical_city(city))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_city_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='user_city_upper_idx',
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='home_city',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='Home City'),
+        ),
+        migrations.RunPython(populate_home_city, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['home_city'], name='user_home_city_idx'),
+        ),
+    ]
@@ -1,8 +1,15 @@
-import hashlib
-from pathlib import Path
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blobs.models import MediaBlob
+from events.geo import canonical_city
+from .authentication import user_cache
+from .caching import invalidate_user_profile
 from .managers import CustomUserManager
 
 class CustomUser(AbstractUser):
@@ -21,6 +28,8 @@ class CustomUser(AbstractUser):
         null=True
     )
     city = models.CharField(_('City'), max_length=100, blank=True, null=True)
+    # La città di ``city`` come in Event.city (events.geo), per le feed
+    home_city = models.CharField(_('Home City'), max_length=100, blank=True, default='', editable=False)
     nation = models.CharField(_('Nation'), max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -29,32 +38,17 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = ['first_name', 'last_name']
     objects = CustomUserManager()
 
-    def _calculate_file_hash(self, file):
-        """Calcola l'hash MD5 di un file."""
-        hasher = hashlib.md5()
-        for chunk in file.chunks():
-            hasher.update(chunk)
-        return hasher.hexdigest()
-
     def save(self, *args, **kwargs):
-        if self.pk:
-            previous = CustomUser.objects.filter(pk=self.pk).first()   
-            if self.profile_picture and self.profile_picture != previous.profile_picture:
-                current_hash = self._calculate_file_hash(self.profile_picture)
-                existing_users = CustomUser.objects.filter(profile_picture__isnull=False)
-                for user in existing_users:
-                    if user.pk != self.pk and user.profile_picture and user.profile_picture.path:
-                        file_path = Path(user.profile_picture.path)
-                        if file_path.exists():
-                            with open(file_path, 'rb') as f:
-                                existing_hash = hashlib.md5(f.read()).hexdigest()
-                                if current_hash == existing_hash:
-                                    self.profile_picture = user.profile_picture
-                                    break
-            if previous and previous.profile_picture and self.profile_picture != previous.profile_picture:
-                previous.profile_picture.delete(save=False)
-
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self.home_city = canonical_city(self.city)
+        if update_fields is not None and 'city' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'home_city'}
+        with transaction.atomic():
+            if update_fields is None or 'profile_picture' in update_fields:
+                # Le immagini profilo sono nel blob store condiviso: un file per contenuto
+                old_picture = CustomUser.objects.filter(pk=self.pk).values_list('profile_picture', flat=True).first() if self.pk else None
+                self.profile_picture = MediaBlob.objects.replace(old_picture, self.profile_picture)
+            super().save(*args, **kwargs)
     
 
     def __str__(self):
@@ -63,3 +57,22 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='user_last_name_trgm_idx'),
+            models.Index(fields=['first_name'], name='user_first_name_idx'),
+            # Utenti della stessa città di un nuovo evento, per le feed
+            models.Index(fields=['home_city'], name='user_home_city_idx'),
+        ]
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_profile_picture(sender, instance, **kwargs):
+    MediaBlob.objects.release(instance.profile_picture.name)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_user_profile(instance.pk)
+    # Anche can_join, can_post, can_comment e is_active cambiano con save():
+    # gli altri processi aggiornano la loro copia entro AUTH_USER_CACHE_TTL
+    user_cache.discard(instance.pk)
@@ -2,6 +2,7 @@ from rest_framework.serializers import ModelSerializer, StringRelatedField
 from rest_framework import serializers 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import AccessToken
+from .caching import cache_user_profile, user_profile
 from .models import CustomUser
 
 
@@ -55,7 +56,8 @@ class GoogleUserSerializer(ModelSerializer):
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         data = super(CustomTokenObtainPairSerializer, self).validate(attrs)
-        data.update({'user': UserSerializer(self.user).data})
+        # Il profilo finisce anche in cache, pronto per i refresh successivi
+        data.update({'user': cache_user_profile(self.user)})
         return data
 
 class CustomTokenRefreshSerializer(TokenRefreshSerializer):
@@ -66,16 +68,11 @@ class CustomTokenRefreshSerializer(TokenRefreshSerializer):
         access_token = data.get('access')
 
         if access_token:
-            # Decodifica il token di accesso per ottenere l'ID utente
-            access_token_obj = AccessToken(access_token)
+            # Il token è appena stato firmato da noi: niente verifica della firma
+            access_token_obj = AccessToken(access_token, verify=False)
             user_id = access_token_obj.get('user_id')
 
-            # Recupera l'utente dal database
-            try:
-                user = CustomUser.objects.get(id=user_id)
-                # Aggiungi i dati dell'utente alla response
-                data.update({'user': UserSerializer(user).data})
-            except CustomUser.DoesNotExist:
-                data.update({'user': None})
+            # Profilo dalla cache (invalidata al salvataggio dell'utente), altrimenti dal database
+            data.update({'user': user_profile(user_id)})
 
         return data
@@ -1,11 +1,20 @@
 from users.models import CustomUser 
+from outbox.models import OutgoingEmail
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
+import time
 import time_machine
+from unittest import mock
 import datetime
 from django.utils import timezone
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
+from users.authentication import user_cache
+from users.caching import profile_key
 from users.token import token_generator
 
 # Create your tests here.
@@ -24,6 +33,11 @@ class CustomUserTest(APITestCase):
         'password': 'samplePsw01!'
     }
 
+    def setUp(self):
+        # La cache su file non segue il rollback dei test
+        cache.clear()
+        user_cache.clear()
+
     def _user_to_dict(self, user):
         """Convert a CustomUser instance to a dictionary matching the response format."""
         return {
@@ -160,6 +174,72 @@ class CustomUserTest(APITestCase):
         self.assertIn('access', response.data)
         self.assertDictEqual(response.data['user'], self._user_to_dict(user))
 
+        with self.subTest("cached profile"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(api_url, {'refresh': str(user_token)})
+            self.assertEqual(len(queries), 0)
+            self.assertDictEqual(response.data['user'], self._user_to_dict(user))
+            # Sulla cache configurata, condivisa con gli altri processi
+            self.assertNotEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+            self.assertEqual(caches.create_connection('default').get(profile_key(user.pk)), response.data['user'])
+
+        with self.subTest("invalidated on save"):
+            user.first_name = 'Nuovo'
+            user.save()
+            response = self.client.post(api_url, {'refresh': str(user_token)})
+            self.assertEqual(response.data['user']['first_name'], 'Nuovo')
+
+
+    def test_search_users(self):
+        api_url = f"{self.api_url}search/"
+        user = CustomUser.objects.create_user(email=self.sample_user['email'], password=self.sample_user['password'], last_name='Rossi')
+        CustomUser.objects.create_user(email='other@example.com', password=self.sample_user['password'], last_name='Bianchi')
+
+        response = self.client.get(api_url, {'q': 'ross'})
+        self.assertEqual([u['last_name'] for u in response.data], [user.last_name])
+
+        with self.subTest("empty query"):
+            for params in ({}, {'q': ''}, {'q': '  '}):
+                response = self.client.get(api_url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, [])
+
+
+    def test_cached_jwt_authentication(self):
+        api_url = f"{self.api_url}auth/profile/"
+        user = CustomUser.objects.create_user(email=self.sample_user['email'], password=self.sample_user['password'])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        user_cache.clear()
+
+        with self.subTest("user resolved from the cache"):
+            self.assertEqual(self.client.get(api_url).status_code, 200)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(api_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), 0)
+
+        with self.subTest("invalidated on save"):
+            user.is_active = False
+            user.save()
+            self.assertEqual(self.client.get(api_url).status_code, 401)
+            self.assertEqual(user_cache.stats()['hits'], 1)
+            self.assertEqual(user_cache.stats()['misses'], 2)
+
+        with self.subTest("saved by another process: expires after the ttl"):
+            CustomUser.objects.filter(pk=user.pk).update(is_active=True)
+            self.assertEqual(self.client.get(api_url).status_code, 200)
+            # Un altro processo non tocca la cache in memoria di questo
+            CustomUser.objects.filter(pk=user.pk).update(is_active=False)
+            self.assertEqual(self.client.get(api_url).status_code, 200)
+            with mock.patch('users.authentication.time') as clock:
+                clock.monotonic.return_value = time.monotonic() + user_cache.ttl + 1
+                self.assertEqual(self.client.get(api_url).status_code, 401)
+
+        with self.subTest("inactive user rejected on a hit"):
+            user.refresh_from_db()
+            user_cache.set(user.pk, user)
+            self.assertEqual(self.client.get(api_url).status_code, 401)
+
      
     @time_machine.travel(datetime.datetime(2024, 12, 16, tzinfo=timezone.get_current_timezone()), tick=False)
     def test_signup_with_google(self):
@@ -197,6 +277,7 @@ class CustomUserTest(APITestCase):
             )
             response = self.client.post(api_url, {'email': self.sample_user['email']})
             self.assertEqual(response.status_code, 200)
+            self.assertEqual(OutgoingEmail.objects.get().to, [self.sample_user['email']])
     
     def test_set_new_password(self):
         api_url = f"{self.api_url}auth/set_new_password/"
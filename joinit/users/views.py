@@ -1,5 +1,5 @@
 from rest_framework import status
-from rest_framework.permissions import AllowAny,IsAuthenticated
+from rest_framework.permissions import AllowAny,IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -11,7 +11,6 @@ from django.db.transaction import atomic
 from django.contrib.auth.hashers import make_password
 from django.contrib.sites.shortcuts import get_current_site
 from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.encoding import force_str, force_bytes
 from django.contrib.auth.base_user import BaseUserManager
@@ -20,11 +19,16 @@ from django.utils import timezone
 
 
 
+from .authentication import user_cache
 from .models import CustomUser
 from . import  serializers
 from events.serializers import EventSerializer
 from users.token import token_generator
 from events.models import Event
+from outbox.models import OutgoingEmail
+from events.fieldsets import narrow_queryset, requested_fields
+from events.pagination import KeysetPagination
+from events.search import contains_filter, fuzzy_threshold, is_fuzzy
 
 # Create your views here.  
 
@@ -65,11 +69,9 @@ class AuthViewSet(viewsets.ViewSet, viewsets.GenericViewSet):
         serializer.is_valid(raise_exception=True)
 
         if 'profile_picture' in request.FILES:
-            user.profile_picture.delete(save=False)
             user.profile_picture = request.FILES['profile_picture']
 
         if 'profile_picture' in request.data and not request.data['profile_picture']:
-            user.profile_picture.delete(save=False)
             user.profile_picture = None
 
         serializer.save()
@@ -112,12 +114,9 @@ class AuthViewSet(viewsets.ViewSet, viewsets.GenericViewSet):
             'uid': urlsafe_base64_encode(force_bytes(user.pk)),
             'token': token_generator.make_token(user),
         })
-        try:
-            email = EmailMessage(mail_subject, message, to=[user.email])
-            email.extra_headers = {'Content-Type': 'text/html'}
-            email.send()
-        except Exception as e:
-            return Response({'Error': 'Email not sent, error: ' + e})
+        # Inviata dal worker send_queued_emails: la richiesta non aspetta il server di posta
+        with atomic():
+            OutgoingEmail.objects.queue(mail_subject, message, [user.email], headers={'Content-Type': 'text/html'})
 
         return Response({'Message': 'Reset password link sent to your email'})
 
@@ -136,28 +135,30 @@ class AuthViewSet(viewsets.ViewSet, viewsets.GenericViewSet):
         else:  
             return Response({'Error': 'Password reset link is invalid!'}, status=status.HTTP_400_BAD_REQUEST)  
     
-    @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny], pagination_class=KeysetPagination)
     def user_events(self, request):
-        user_events = request.user.events.order_by('-event_date')
+        user_events = request.user.events.for_listing().order_by('-event_date', '-id')
+        user_events = narrow_queryset(user_events, requested_fields(request))
 
         page = self.paginate_queryset(user_events)
         if page is not None:
-            serializer = EventSerializer(page, many=True, context={'request': request})  
+            serializer = EventSerializer(page, many=True, context={'request': request}, fields=requested_fields(request))
             return self.get_paginated_response(serializer.data)
 
-        serializer = EventSerializer(user_events, many=True, context={'request': request})  
+        serializer = EventSerializer(user_events, many=True, context={'request': request}, fields=requested_fields(request))
         return Response(serializer.data)
     
     @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
     def joined_events_past(self, request):
-        joined_events = request.user.joined_events.order_by('-event_date')
+        joined_events = request.user.joined_events.for_listing().order_by('-event_date')
+        joined_events = narrow_queryset(joined_events, requested_fields(request))
 
         page = self.paginate_queryset(joined_events)
         if page is not None:
-            serializer = EventSerializer(page, many=True, context={'request': request})  
+            serializer = EventSerializer(page, many=True, context={'request': request}, fields=requested_fields(request))
             return self.get_paginated_response(serializer.data)
 
-        serializer = EventSerializer(joined_events, many=True, context={'request': request})  
+        serializer = EventSerializer(joined_events, many=True, context={'request': request}, fields=requested_fields(request))
         return Response(serializer.data)
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -170,14 +171,25 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             return serializers.UserEditSerializer
         return serializers.UserBaseInfoSerializer
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def auth_cache_stats(self, request):
+        """Statistiche della cache degli utenti autenticati di questo processo."""
+        return Response(user_cache.stats())
+
     @action(detail=False, methods=['get'])
     def search(self, request, *args, **kwargs):
-        users = CustomUser.objects.filter(
-                Q(last_name__icontains=request.query_params.get('q')) | Q(first_name=request.query_params.get('q')))
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            # Una ricerca vuota troverebbe tutti gli utenti
+            return Response([])
+        fuzzy = is_fuzzy(request)
+        users = CustomUser.objects.filter(contains_filter('last_name', q, fuzzy) | Q(first_name=q))
         users_srlz = serializers.UserBaseInfoSerializer(users, many=True)
-        return Response(users_srlz.data)
+        with fuzzy_threshold(fuzzy):
+            data = users_srlz.data
+        return Response(data)
 
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
     def get_user_events(self, request, pk):
         try:
             user = CustomUser.objects.get(id=pk)
@@ -185,29 +197,30 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({"message": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
         try:
-            user_events = user.events.filter(is_private=False).order_by('-event_date')
+            user_events = user.events.filter(is_private=False).for_listing().order_by('-event_date', '-id')
         except AttributeError:
             return Response({"message": "this user has no events"}, status=status.HTTP_404_NOT_FOUND)
-        
+        user_events = narrow_queryset(user_events, requested_fields(request))
 
         page = self.paginate_queryset(user_events)
         if page is not None:
-            serializer = EventSerializer(page, many=True,context={'request': request})
+            serializer = EventSerializer(page, many=True,context={'request': request}, fields=requested_fields(request))
             return self.get_paginated_response(serializer.data)
         
-        serializer = EventSerializer(user_events, many=True,context={'request': request})
+        serializer = EventSerializer(user_events, many=True,context={'request': request}, fields=requested_fields(request))
         return Response(serializer.data)
     
     @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
     def joined_events_past(self, request):
-        joined_events = request.user.joined_events.order_by('-event_date')
+        joined_events = request.user.joined_events.for_listing().order_by('-event_date')
+        joined_events = narrow_queryset(joined_events, requested_fields(request))
 
         page = self.paginate_queryset(joined_events)
         if page is not None:
-            serializer = EventSerializer(page, many=True, context={'request': request})  
+            serializer = EventSerializer(page, many=True, context={'request': request}, fields=requested_fields(request))
             return self.get_paginated_response(serializer.data)
 
-        serializer = EventSerializer(joined_events, many=True, context={'request': request})  
+        serializer = EventSerializer(joined_events, many=True, context={'request': request}, fields=requested_fields(request))
         return Response(serializer.data)
     
 class TokenRefreshView(TokenRefreshView):